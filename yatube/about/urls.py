@@ -1,10 +1,21 @@
 from django.urls import path
 
+from core.cache import conditional_page
+from core.page_cache import cached_page
+
 from . import views
 
 app_name = 'about'
 
 urlpatterns = [
-    path('author/', views.AboutAuthorView.as_view(), name='author'),
-    path('tech/', views.AboutTechView.as_view(), name='tech'),
+    path(
+        'author/',
+        conditional_page()(cached_page()(views.AboutAuthorView.as_view())),
+        name='author',
+    ),
+    path(
+        'tech/',
+        conditional_page()(cached_page()(views.AboutTechView.as_view())),
+        name='tech',
+    ),
 ]
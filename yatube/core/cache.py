@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .metrics import CACHE_COMPUTE
+from .routers import reading_replica
+
+logger = logging.getLogger(__name__)
+
+# Версии (поколения) кэшируемых фрагментов. Версия входит в ключ фрагмента,
+# поэтому сдвиг версии при изменении данных сразу делает устаревшие фрагменты
+# недостижимыми, и их можно хранить долго. Новая версия берётся из текущего
+# времени в наносекундах: даже если счётчик вытеснят из кэша, он не вернётся
+# к значению, под которым уже лежат старые фрагменты.
+
+
+def _version_key(scope):
+    return 'version:' + ':'.join(str(part) for part in scope)
+
+
+def get_version(*scope):
+    """Текущая версия фрагментов области, например ('group', 5)."""
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_versions(*scopes):
+    """Делает недействительными фрагменты перечисленных областей."""
+    version = time.time_ns()
+    cache.set_many(
+        {_version_key(scope): version for scope in scopes}, timeout=None)
+
+
+def fragment_context(*scope):
+    """Переменная шаблона для {% cache cache_ttl ... cache_version %}."""
+    version = get_version(*scope)
+    if reading_replica():
+        # Реплика может отставать: такие фрагменты хранятся отдельно, и
+        # пользователь, читающий из основной базы, их не получит.
+        version = f'{version}-replica'
+    return {
+        'cache_version': version,
+    }
+
+
+def page_versions(request, scopes, args=(), kwargs=None):
+    """Версии областей страницы или None, если проверять нечего.
+
+    scopes(request, *args, **kwargs) возвращает области страницы или None.
+    conditional_page и cached_page спрашивают их за один запрос дважды,
+    поэтому ответ каждой функции scopes запоминается в запросе.
+    """
+    known = request.__dict__.setdefault('_page_versions', {})
+    if scopes not in known:
+        found = scopes(request, *args, **(kwargs or {})) if scopes else []
+        known[scopes] = None if found is None else [
+            get_version(*scope) for scope in found]
+    return known[scopes]
+
+
+def _page_etag(request, versions):
+    csrf_token = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    user = ''
+    if request.user.is_authenticated:
+        user = f'{request.user.pk}:{request.session.session_key}'
+    raw = f'{settings.PAGE_ETAG_SALT}:{user}:{csrf_token}:' + ':'.join(
+        str(version) for version in versions)
+    if reading_replica():
+        period = int(time.time() // settings.REPLICA_FRAGMENT_CACHE_TTL)
+        raw += f':replica:{period}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def conditional_page(scopes=None, viewer_scopes=None):
+    """Декоратор: ответ 304 Not Modified, пока не сдвинулись версии страницы.
+
+    scopes(request, *args, **kwargs) возвращает области, от которых зависит
+    страница, или None, если проверять нечего (например, объекта нет).
+    Страница без scopes меняется только с PAGE_ETAG_SALT.
+    viewer_scopes(request) - области посетителя (например, его подписки):
+    они меняют только ETag, а не общую страницу в cached_page.
+    ETag складывается из версий областей, пользователя, его сессии и
+    CSRF-куки и PAGE_ETAG_SALT: формы страницы несут токен сессии, и после
+    нового входа старая копия из браузера не годится. Last-Modified - время
+    последнего сдвига версии - получают только гости: страница пользователя
+    зависит не от одного времени. Страница из реплики могла отстать от
+    версий, поэтому её ETag живёт не дольше REPLICA_FRAGMENT_CACHE_TTL, как
+    и фрагменты из реплики.
+    """
+    def etag(request, *args, **kwargs):
+        versions = page_versions(request, scopes, args, kwargs)
+        if versions is None:
+            return None
+        if viewer_scopes:
+            versions = versions + [
+                get_version(*scope) for scope in viewer_scopes(request)]
+        return _page_etag(request, versions)
+
+    def last_modified(request, *args, **kwargs):
+        versions = page_versions(request, scopes, args, kwargs)
+        if (not versions or request.user.is_authenticated
+                or reading_replica()):
+            return None
+        return datetime.fromtimestamp(max(versions) / 1e9, tz=timezone.utc)
+
+    def decorator(view):
+        conditional = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            # Браузер должен спрашивать сервер, а не угадывать свежесть.
+            patch_cache_control(response, no_cache=True)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True)
+            return response
+        return wrapper
+
+    return decorator
+
+
+# Защита от «толпы» при промахе: значение пересчитывает один запрос,
+# взявший блокировку ключа, остальные ждут его результата. Запись хранит
+# срок свежести отдельно от срока жизни в кэше, поэтому после устаревания
+# ещё stale_ttl секунд остальные запросы получают прежнее значение, пока
+# владелец блокировки считает новое.
+
+
+def acquire_lock(key, timeout):
+    """Токен блокировки или None, если ключ уже занят."""
+    token = uuid.uuid4().hex
+    return token if cache.add(key, token, timeout) else None
+
+
+def release_lock(key, token):
+    # Снимаем только свою блокировку: чужая могла занять ключ, пока наша
+    # истекла по таймауту.
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def get_or_compute(key, compute, ttl, stale_ttl=0, cache_if=None):
+    """Значение ключа с пересчётом одним запросом на все процессы.
+
+    compute() вызывается, только если значения нет или оно старше ttl
+    секунд. Устаревшее значение отдаётся ещё stale_ttl секунд всем, кроме
+    пересчитывающего запроса, а при ошибке пересчёта - и ему. Запросы,
+    которым отдать нечего, ждут чужого пересчёта до SINGLE_FLIGHT_WAIT
+    секунд, а потом считают сами. cache_if(value) решает, сохранять ли
+    результат.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry[0] > now:
+        CACHE_COMPUTE.labels('fresh').inc()
+        return entry[1]
+    lock = f'lock:{key}'
+    token = acquire_lock(lock, settings.SINGLE_FLIGHT_LOCK_TIMEOUT)
+    if token is None and entry is not None:
+        CACHE_COMPUTE.labels('stale').inc()
+        return entry[1]
+    if token is None:
+        deadline = now + settings.SINGLE_FLIGHT_WAIT
+        while time.time() < deadline:
+            time.sleep(settings.SINGLE_FLIGHT_POLL)
+            entry = cache.get(key)
+            if entry is not None:
+                CACHE_COMPUTE.labels('waited').inc()
+                return entry[1]
+    CACHE_COMPUTE.labels('computed').inc()
+    try:
+        value = compute()
+        if cache_if is None or cache_if(value):
+            cache.set(key, (time.time() + ttl, value), ttl + stale_ttl)
+        return value
+    except Exception:
+        if entry is None:
+            raise
+        logger.exception('Пересчёт %s не удался, отдано старое значение', key)
+        return entry[1]
+    finally:
+        if token is not None:
+            release_lock(lock, token)
@@ -0,0 +1,189 @@
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.module_loading import import_string
+
+from .metrics import CACHE_L1_REQUESTS, CACHE_REQUESTS
+
+FRAGMENT_PREFIX = 'template.cache.'
+
+_missing = object()
+
+
+def create_inner(location, params):
+    """Вложенный бэкенд из OPTIONS['BACKEND'] и OPTIONS['OPTIONS'].
+
+    Возвращает бэкенд и оставшиеся OPTIONS обёртки.
+    """
+    params = dict(params)
+    options = dict(params.pop('OPTIONS', None) or {})
+    backend = options.pop('BACKEND')
+    params['OPTIONS'] = options.pop('OPTIONS', {})
+    return import_string(backend)(location, params), options
+
+
+class MetricsCache(BaseCache):
+    """Обёртка над любым бэкендом кэша, считающая попадания и промахи.
+
+    Настоящий бэкенд задаётся в OPTIONS['BACKEND'], его собственные
+    параметры - в OPTIONS['OPTIONS']; LOCATION, TIMEOUT, KEY_PREFIX и
+    VERSION передаются ему как есть. OPTIONS['ALIAS'] - метка кэша
+    в метриках. Ключи фрагментов {% cache %} считаются отдельно.
+    """
+
+    def __init__(self, location, params):
+        super().__init__({})
+        self.inner, options = create_inner(location, params)
+        self.alias = options.get('ALIAS', 'default')
+
+    def __getattr__(self, name):
+        if name == 'inner':
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _count(self, key, hit):
+        kind = 'fragment' if key.startswith(FRAGMENT_PREFIX) else 'object'
+        CACHE_REQUESTS.labels(
+            self.alias, kind, 'hit' if hit else 'miss').inc()
+
+    def get(self, key, default=None, version=None):
+        value = self.inner.get(key, _missing, version=version)
+        self._count(key, value is not _missing)
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.inner.get_many(keys, version=version)
+        for key in keys:
+            self._count(key, key in found)
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.add(key, value, timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set_many(data, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        return self.inner.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self.inner.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.inner.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.inner.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.inner.decr(key, delta, version=version)
+
+    def clear(self):
+        return self.inner.clear()
+
+    def close(self, **kwargs):
+        return self.inner.close(**kwargs)
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш: память процесса (L1) перед общим кэшем (L2).
+
+    L2 задаётся так же, как в MetricsCache. Значения из L2 копируются в L1
+    на OPTIONS['L1_TIMEOUT'] секунд, поэтому горячие ключи вроде версий
+    фрагментов читаются без похода в сеть. Запись идёт в оба уровня, а
+    чужие процессы увидят изменение не позже, чем истечёт их L1.
+    Атомарные add, incr и decr выполняет только L2.
+    """
+
+    def __init__(self, location, params):
+        super().__init__({})
+        self.l2, options = create_inner(location, params)
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        # Потоки процесса делят один L1, как и обычный LocMemCache.
+        l1_location = options.get('L1_LOCATION', location)
+        self.l1 = LocMemCache(f'tiered-l1-{l1_location}', {
+            'TIMEOUT': self.l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000)},
+        })
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self.l1.get(key, _missing, version=version)
+        CACHE_L1_REQUESTS.labels('miss' if value is _missing else 'hit').inc()
+        if value is _missing:
+            value = self.l2.get(key, _missing, version=version)
+            if value is _missing:
+                return default
+            self.l1.set(key, value, self.l1_timeout, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.l1.get_many(keys, version=version)
+        CACHE_L1_REQUESTS.labels('hit').inc(len(found))
+        missing = [key for key in keys if key not in found]
+        if missing:
+            CACHE_L1_REQUESTS.labels('miss').inc(len(missing))
+            shared = self.l2.get_many(missing, version=version)
+            self.l1.set_many(shared, self.l1_timeout, version=version)
+            found.update(shared)
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self.l1.set(key, value, self._l1_timeout(timeout), version)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self.l1.set(key, value, self._l1_timeout(timeout), version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        self.l1.set_many(data, self._l1_timeout(timeout), version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.touch(key, self._l1_timeout(timeout), version)
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l1.delete_many(keys, version=version)
+        return self.l2.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return (
+            self.l1.has_key(key, version=version)
+            or self.l2.has_key(key, version=version)
+        )
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.decr(key, delta, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        return self.l2.clear()
+
+    def close(self, **kwargs):
+        return self.l2.close(**kwargs)
@@ -0,0 +1,17 @@
+from django.conf import settings
+
+from core.routers import reading_replica
+
+
+def cache_ttl(request):
+    """Добавляет время жизни кэшируемых фрагментов шаблонов.
+
+    Фрагменты из данных реплики живут недолго, чтобы отставание реплики
+    не задерживалось в кэше до следующей смены версии.
+    """
+    ttl = settings.FRAGMENT_CACHE_TTL
+    if reading_replica():
+        ttl = min(ttl, settings.REPLICA_FRAGMENT_CACHE_TTL)
+    return {
+        'cache_ttl': ttl,
+    }
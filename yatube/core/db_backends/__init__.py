@@ -0,0 +1,5 @@
+from django.db import OperationalError
+
+
+class PoolExhausted(OperationalError):
+    """Все соединения пула заняты и ни одно не освободилось вовремя."""
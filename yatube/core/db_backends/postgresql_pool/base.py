@@ -0,0 +1,79 @@
+from threading import Lock
+from time import monotonic, sleep
+
+from django.db.backends.postgresql import base
+from psycopg2 import pool
+
+from .. import PoolExhausted
+
+# PostgreSQL с пулом соединений в каждом процессе. Django закрывает
+# соединение в конце запроса (при CONN_MAX_AGE = 0), а этот бэкенд вместо
+# закрытия возвращает его в пул, и следующий запрос не платит за новое
+# подключение. Размер пула задаётся в OPTIONS ключами POOL_MIN_SIZE и
+# POOL_MAX_SIZE; остальные OPTIONS уходят в psycopg2.connect как обычно.
+# Если все соединения заняты, запрос ждёт свободное POOL_TIMEOUT секунд,
+# а потом получает PoolExhausted, на который DatabaseBusyMiddleware
+# отвечает 503.
+
+POOL_OPTIONS = ('POOL_MIN_SIZE', 'POOL_MAX_SIZE', 'POOL_TIMEOUT')
+
+POOL_POLL_INTERVAL = 0.05
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def get_pool(alias, min_size, max_size, conn_params):
+    """Пул соединений базы alias, общий для всех потоков процесса."""
+    with _pools_lock:
+        connection_pool = _pools.get(alias)
+        if connection_pool is None or connection_pool.closed:
+            connection_pool = _pools[alias] = pool.ThreadedConnectionPool(
+                min_size, max_size, **conn_params)
+        return connection_pool
+
+
+def close_pools():
+    with _pools_lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        options = self.settings_dict['OPTIONS']
+        self.pool_size = (
+            options.get('POOL_MIN_SIZE', 1), options.get('POOL_MAX_SIZE', 10))
+        self.pool_timeout = options.get('POOL_TIMEOUT', 2)
+        params = super().get_connection_params()
+        for name in POOL_OPTIONS:
+            params.pop(name, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, *self.pool_size, conn_params)
+        deadline = monotonic() + self.pool_timeout
+        while True:
+            try:
+                return self.pool.getconn()
+            except pool.PoolError:
+                # ThreadedConnectionPool не ждёт, а сразу сообщает, что
+                # свободных соединений нет.
+                if self.pool.closed:
+                    raise
+                if monotonic() >= deadline:
+                    raise PoolExhausted(
+                        f'Все {self.pool_size[1]} соединений пула '
+                        f'{self.alias!r} заняты дольше '
+                        f'{self.pool_timeout} с')
+            sleep(POOL_POLL_INTERVAL)
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            # Битое соединение пул закрывает, а незавершённую транзакцию
+            # откатывает сам.
+            self.pool.putconn(
+                self.connection, close=bool(self.connection.closed))
@@ -0,0 +1,270 @@
+from bisect import bisect_left
+from threading import Lock
+
+# Небольшой реестр метрик в духе Prometheus: счётчики, гистограммы и
+# датчики с метками. Представления, кэш и обработка картинок пишут сюда,
+# а /metrics/ отдаёт всё в текстовом формате, который понимает Prometheus.
+# Реестр свой у каждого процесса: воркеры gunicorn опрашиваются порознь.
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('\n', '\\n')
+        .replace('"', '\\"')
+    )
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._children = {}
+
+    def labels(self, *values, **kwargs):
+        """Дочерняя метрика для конкретных значений меток."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(
+                f'{self.name}: ожидались метки {self.labelnames}')
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f'{self.name}: не указаны метки')
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Строки (имя, метки, значение) для текстового формата."""
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            yield from self._child_samples(values, child)
+
+    def _child_samples(self, values, child):
+        yield self.name, _format_labels(self.labelnames, values), child.get()
+
+
+class _Value:
+    def __init__(self):
+        self._lock = Lock()
+        self._value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def get(self):
+        with self._lock:
+            return self._value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Счётчик не может уменьшаться')
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def get(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def _child_samples(self, values, child):
+        counts, total, count = child.get()
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(
+                self.labelnames, values, [('le', _format_value(bound))])
+            yield f'{self.name}_bucket', labels, cumulative
+        labels = _format_labels(self.labelnames, values, [('le', '+Inf')])
+        yield f'{self.name}_bucket', labels, count
+        labels = _format_labels(self.labelnames, values)
+        yield f'{self.name}_sum', labels, total
+        yield f'{self.name}_count', labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Метрика {metric.name} уже есть')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(
+        Histogram(name, documentation, labelnames, buckets))
+
+
+REQUEST_LATENCY = histogram(
+    'yatube_http_request_duration_seconds',
+    'Время обработки HTTP-запроса.',
+    ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = histogram(
+    'yatube_http_request_db_queries',
+    'Число запросов к базе на один HTTP-запрос.',
+    ('view',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+DB_QUERIES = counter(
+    'yatube_db_queries_total',
+    'Запросы к базе данных.',
+    ('view',),
+)
+DB_QUERY_TIME = counter(
+    'yatube_db_query_seconds_total',
+    'Суммарное время запросов к базе данных.',
+    ('view',),
+)
+CACHE_REQUESTS = counter(
+    'yatube_cache_requests_total',
+    'Чтения из кэша: kind - fragment для {% cache %} или object.',
+    ('cache', 'kind', 'result'),
+)
+CACHE_L1_REQUESTS = counter(
+    'yatube_cache_l1_requests_total',
+    'Чтения из памяти процесса в двухуровневом кэше.',
+    ('result',),
+)
+CACHE_COMPUTE = counter(
+    'yatube_cache_compute_total',
+    'Чтения через get_or_compute: fresh, stale, computed или waited.',
+    ('result',),
+)
+THUMBNAIL_TIME = histogram(
+    'yatube_thumbnail_generation_seconds',
+    'Время подготовки всех вариантов одной картинки.',
+)
+THUMBNAIL_FAILURES = counter(
+    'yatube_thumbnail_failures_total',
+    'Картинки, которые не удалось подготовить.',
+)
+THUMBNAIL_IN_PROGRESS = gauge(
+    'yatube_thumbnail_jobs',
+    'Картинки в очереди и в работе.',
+)
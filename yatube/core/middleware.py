@@ -0,0 +1,244 @@
+import logging
+from contextlib import ExitStack
+from threading import Lock, local
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from . import metrics, routers
+from .db_backends import PoolExhausted
+
+logger = logging.getLogger(__name__)
+
+_current = local()
+
+
+def current_stats():
+    """Статистика запроса, который обрабатывается в этом потоке."""
+    return getattr(_current, 'stats', None)
+
+
+class RequestStats:
+    """Запросы к базе и время этапов одного HTTP-запроса."""
+
+    def __init__(self):
+        self.queries = []
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_depth = 0
+        self.view_time = 0.0
+        self.total_time = 0.0
+        self.view_started = None
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    def slowest_queries(self, limit):
+        return sorted(self.queries, reverse=True)[:limit]
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.sql_time += duration
+            self.queries.append((duration, sql))
+
+
+class RequestStatsRegistry:
+    """Накопленная статистика запросов по именам URL."""
+
+    FIELDS = ('total_time', 'view_time', 'render_time', 'sql_time')
+
+    def __init__(self):
+        self._lock = Lock()
+        self._data = {}
+
+    def add(self, url_name, stats):
+        with self._lock:
+            entry = self._data.setdefault(url_name, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'max_time': 0.0,
+                **{field: 0.0 for field in self.FIELDS},
+            })
+            entry['requests'] += 1
+            entry['queries'] += stats.query_count
+            entry['max_queries'] = max(
+                entry['max_queries'], stats.query_count)
+            entry['max_time'] = max(entry['max_time'], stats.total_time)
+            for field in self.FIELDS:
+                entry[field] += getattr(stats, field)
+
+    def snapshot(self):
+        """Средние и максимальные значения по каждому имени URL."""
+        with self._lock:
+            result = {}
+            for url_name, entry in self._data.items():
+                requests = entry['requests']
+                result[url_name] = {
+                    'requests': requests,
+                    'avg_queries': entry['queries'] / requests,
+                    'max_queries': entry['max_queries'],
+                    'max_time_ms': entry['max_time'] * 1000,
+                    **{
+                        f'avg_{field}_ms': entry[field] / requests * 1000
+                        for field in self.FIELDS
+                    },
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+registry = RequestStatsRegistry()
+
+
+class RequestStatsMiddleware:
+    """Считает запросы к базе, время SQL, шаблонов и представления.
+
+    Итоги копятся в registry по имени URL и в метриках core.metrics,
+    а медленные запросы и запросы со слишком большим числом обращений
+    к базе пишутся в лог вместе с самыми долгими SQL. Заголовок
+    Server-Timing получают сотрудники или все при DEBUG: посторонним
+    время бэкенда не показывается.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        _current.stats = stats
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(
+                        stats.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.stats = None
+        end = perf_counter()
+        stats.total_time = end - start
+        if stats.view_started is not None:
+            stats.view_time = end - stats.view_started
+        match = request.resolver_match
+        url_name = match.view_name if match else None
+        registry.add(url_name, stats)
+        self.report_metrics(request, response, url_name, stats)
+        if self.show_timing(request):
+            response['Server-Timing'] = self.server_timing(stats)
+        self.log_if_slow(request, url_name, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_stats()
+        if stats is not None:
+            stats.view_started = perf_counter()
+
+    @staticmethod
+    def report_metrics(request, response, url_name, stats):
+        # Неизвестные адреса сводятся в одну метку, чтобы 404 от ботов
+        # не плодили ряды.
+        view = url_name or 'unresolved'
+        metrics.REQUEST_LATENCY.labels(
+            view, request.method, response.status_code,
+        ).observe(stats.total_time)
+        metrics.REQUEST_QUERIES.labels(view).observe(stats.query_count)
+        metrics.DB_QUERIES.labels(view).inc(stats.query_count)
+        metrics.DB_QUERY_TIME.labels(view).inc(stats.sql_time)
+
+    @staticmethod
+    def show_timing(request):
+        if settings.DEBUG:
+            return True
+        # Пользователя ставит AuthenticationMiddleware, стоящий ниже.
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    @staticmethod
+    def server_timing(stats):
+        return ', '.join((
+            f'sql;dur={stats.sql_time * 1000:.1f};'
+            f'desc="{stats.query_count} queries"',
+            f'render;dur={stats.render_time * 1000:.1f}',
+            f'view;dur={stats.view_time * 1000:.1f}',
+            f'total;dur={stats.total_time * 1000:.1f}',
+        ))
+
+    @staticmethod
+    def log_if_slow(request, url_name, stats):
+        if (
+            stats.total_time * 1000 < settings.REQUEST_STATS_SLOW_MS
+            and stats.query_count <= settings.REQUEST_STATS_MAX_QUERIES
+        ):
+            return
+        slowest = '\n'.join(
+            f'  {duration * 1000:.1f} ms: {sql}'
+            for duration, sql in stats.slowest_queries(
+                settings.REQUEST_STATS_SLOWEST_QUERIES)
+        )
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.1f ms, %d SQL за %.1f ms, '
+            'шаблоны %.1f ms\n%s',
+            request.method, request.path, url_name,
+            stats.total_time * 1000, stats.query_count,
+            stats.sql_time * 1000, stats.render_time * 1000, slowest,
+        )
+
+
+class DatabaseBusyMiddleware:
+    """Отвечает 503 вместо 500, когда все соединения пула заняты.
+
+    Ответ без шаблона: страница ошибки сама полезла бы в базу.
+    """
+
+    RETRY_AFTER = 5
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, PoolExhausted):
+            return None
+        logger.warning('%s %s: %s', request.method, request.path, exception)
+        response = HttpResponse(
+            'Сервер перегружен, попробуйте позже.', status=503)
+        response['Retry-After'] = self.RETRY_AFTER
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """Ставит метку чтения из основной базы после записи.
+
+    Пока метка жива, представления с use_replica не уходят на реплики,
+    и пользователь сразу видит свой пост, комментарий или подписку.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_request()
+        try:
+            response = self.get_response(request)
+            if routers.request_wrote():
+                response.set_cookie(
+                    settings.REPLICA_STICKY_COOKIE, '1',
+                    max_age=settings.REPLICA_STICKY_SECONDS,
+                    httponly=True, samesite='Lax',
+                )
+        finally:
+            routers.start_request()
+        return response
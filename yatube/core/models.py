@@ -1,7 +1,21 @@
-from django.db import models
+from django.db import models, router, transaction
 
 
-class CreatedModel(models.Model):
+class AtomicSaveModel(models.Model):
+    """Абстрактная модель. Сохраняет запись вместе с работой обработчиков
+    post_save в одной транзакции."""
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class CreatedModel(AtomicSaveModel):
     """Абстрактная модель. Добавляет дату создания."""
     created = models.DateTimeField(
         'Дата публикации',
@@ -0,0 +1,134 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+from .cache import get_or_compute, page_versions
+from .routers import reading_replica
+
+# Кэш целых страниц. Страница кэшируется одна на всех: места, зависящие от
+# посетителя (шапка, кнопка подписки, форма комментария), размечаются в
+# шаблоне тегом {% hole %} и в кэш попадают метками. При каждом ответе
+# метки заменяются дырами, отрисованными для текущего посетителя, так что
+# гость получает страницу без запросов к базе, а пользователь - без
+# запросов ленты. Дыры описаны в PAGE_CACHE_HOLES: шаблон и функция,
+# которая по запросу и параметрам дыры готовит её контекст.
+
+MARKER = '<!--hole:{}-->'
+
+# Страницу меняют только курсоры и номер страницы. Остальные параметры
+# (метки кампаний, ?reply_to= для дыры формы) в ключ не идут, иначе
+# каждый случайный ?x= рисовал бы и хранил свою копию страницы.
+PAGE_PARAMS = ('after', 'before', 'page')
+
+
+def render_hole(request, name, params):
+    """HTML дыры для посетителя запроса."""
+    template_name, context_function = settings.PAGE_CACHE_HOLES[name]
+    context = dict(params)
+    if context_function:
+        context.update(import_string(context_function)(request, **params))
+    return render_to_string(template_name, context, request)
+
+
+def punch(request, name, params):
+    """Дыра сразу или метка, если страница собирается для кэша."""
+    holes = getattr(request, '_page_holes', None)
+    if holes is None:
+        return render_hole(request, name, params)
+    holes.append((name, params))
+    return MARKER.format(len(holes) - 1)
+
+
+def fill_holes(request, content, holes):
+    for number, (name, params) in enumerate(holes):
+        content = content.replace(
+            MARKER.format(number), render_hole(request, name, params), 1)
+    return content
+
+
+def _page_key(request, versions):
+    params = urlencode([
+        (name, request.GET[name])
+        for name in PAGE_PARAMS if name in request.GET
+    ])
+    raw = ':'.join([
+        settings.PAGE_ETAG_SALT,
+        request.path,
+        params,
+        *(str(version) for version in versions),
+    ])
+    key = 'page:' + hashlib.md5(raw.encode()).hexdigest()
+    if reading_replica():
+        key += '-replica'
+    return key
+
+
+def _render_skeleton(request, view, args, kwargs):
+    """Ответ представления с метками вместо дыр и список этих дыр."""
+    request._page_holes = []
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response = response.render()
+    finally:
+        holes = request.__dict__.pop('_page_holes')
+    return response, holes
+
+
+def cached_page(scopes=None):
+    """Декоратор: страница из кэша с дырами для текущего посетителя.
+
+    scopes - те же области, что у conditional_page: новая версия любой из
+    них даёт новый ключ страницы. Областей посетителя здесь нет: всё, что
+    от него зависит, - дыры. Без scopes страница живёт весь
+    PAGE_CACHE_TTL. Кэшируются только ответы 200 на GET и HEAD.
+    Дыры не должны лежать внутри {% swrcache %}: фрагмент сохранил бы
+    метку.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = page_versions(request, scopes, args, kwargs)
+            if versions is None:
+                return view(request, *args, **kwargs)
+            ttl = settings.PAGE_CACHE_TTL
+            if reading_replica():
+                ttl = min(ttl, settings.REPLICA_FRAGMENT_CACHE_TTL)
+            rendered = {}
+
+            def render():
+                response, holes = _render_skeleton(request, view, args, kwargs)
+                rendered.update(response=response, holes=holes)
+                if (response.streaming or response.status_code != 200
+                        or response.cookies):
+                    return None
+                return (
+                    response['Content-Type'],
+                    response.content.decode(response.charset),
+                    holes,
+                )
+
+            # При промахе страницу рисует один запрос, остальные ждут его.
+            entry = get_or_compute(
+                _page_key(request, versions), render, ttl, cache_if=bool)
+            if rendered:
+                response, holes = rendered['response'], rendered['holes']
+                if response.streaming:
+                    return response
+                content = response.content.decode(response.charset)
+            else:
+                content_type, content, holes = entry
+                response = HttpResponse(content_type=content_type)
+            response.content = fill_holes(request, content, holes)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+class LazyRows(Sequence):
+    """Записи страницы, которые читаются при первом обращении."""
+
+    def __init__(self, load):
+        self._load = load
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __len__(self):
+        return len(self._load())
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (created, id) вместо OFFSET и COUNT(*).
+
+    Страница выбирается условием «строго старше/новее ключа крайней
+    записи», поэтому любая страница ленты стоит одного индексированного
+    чтения. Переходы кодируются непрозрачными токенами ?after= и ?before=.
+    """
+
+    def __init__(self, object_list, per_page, fields=('created', 'pk')):
+        self.fields = fields
+        super().__init__(
+            object_list.order_by(*(f'-{name}' for name in fields)),
+            per_page,
+        )
+        self.number = 1
+        self._key = None
+        self._rows = None
+        self._next_cursor = None
+        self._previous_cursor = None
+
+    @property
+    def num_pages(self):
+        # Общее число страниц неизвестно: достаточно знать,
+        # есть ли страница дальше текущей.
+        return self.number + 1 if self.next_cursor else self.number
+
+    @property
+    def next_cursor(self):
+        self.load()
+        return self._next_cursor
+
+    @property
+    def previous_cursor(self):
+        self.load()
+        return self._previous_cursor
+
+    def encode_cursor(self, obj):
+        raw = '|'.join(str(self._value(obj, name)) for name in self.fields)
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """Возвращает значения ключа из токена или None, если он испорчен."""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            parts = urlsafe_b64decode(padded.encode()).decode().split('|')
+        except (DecodeError, UnicodeDecodeError, ValueError):
+            return None
+        if len(parts) != len(self.fields):
+            return None
+        model = self.object_list.model
+        try:
+            return [
+                self._field(model, name).to_python(part)
+                for name, part in zip(self.fields, parts)
+            ]
+        except ValidationError:
+            return None
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после/до курсора или первую страницу.
+
+        Записи читаются при первом обращении к странице, поэтому
+        закэшированный фрагмент шаблона обходится без запроса к базе.
+        """
+        key = self.decode_cursor(before) if before else None
+        if key is not None:
+            rows = self.fetch(key, older=False)
+            # Если новее курсора меньше полной страницы, это начало ленты.
+            if len(rows) > self.per_page:
+                self._previous_cursor = self.encode_cursor(rows[1])
+                self._next_cursor = self.encode_cursor(rows[-1])
+                self._rows = rows[1:]
+                self.number = 2
+                return self._get_page(self._rows, self.number, self)
+        self._key = self.decode_cursor(after) if after else None
+        if self._key is not None:
+            self.number = 2
+        return self._get_page(LazyRows(self.load), self.number, self)
+
+    def load(self):
+        if self._rows is None:
+            rows = self.fetch(self._key, older=True)
+            page = rows[:self.per_page]
+            if self._key is not None and page:
+                self._previous_cursor = self.encode_cursor(page[0])
+            if len(rows) > self.per_page:
+                self._next_cursor = self.encode_cursor(page[-1])
+            self._rows = page
+        return self._rows
+
+    def fetch(self, key, older):
+        """Читает per_page + 1 записей от ключа, от новых к старым."""
+        queryset = self.object_list
+        if key is not None:
+            queryset = queryset.filter(self._key_filter(key, older))
+        if older:
+            return list(queryset[:self.per_page + 1])
+        ascending = queryset.order_by(*self.fields)[:self.per_page + 1]
+        return list(ascending)[::-1]
+
+    def _key_filter(self, key, older, fields=None):
+        fields = fields or self.fields
+        lookup = 'lt' if older else 'gt'
+        condition = Q()
+        for position, name in enumerate(fields):
+            equal = dict(zip(fields[:position], key[:position]))
+            equal[f'{name}__{lookup}'] = key[position]
+            condition |= Q(**equal)
+        return condition
+
+    @staticmethod
+    def _field(model, name):
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+    @staticmethod
+    def _value(obj, name):
+        value = getattr(obj, name)
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def paginate(request, object_list, per_page=None, **kwargs):
+    """Страница ленты по курсорам из GET-параметров запроса."""
+    paginator = CursorPaginator(
+        object_list, per_page or settings.POST_COUNT, **kwargs)
+    return paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
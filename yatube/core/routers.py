@@ -0,0 +1,80 @@
+import random
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+
+from django.conf import settings
+
+# Чтение в представлениях, помеченных use_replica, уходит на реплики из
+# REPLICA_DATABASES, всё остальное - на основную базу. Пользователь, который
+# только что что-то записал, REPLICA_STICKY_SECONDS секунд читает из основной
+# базы (метку ставит ReplicaStickinessMiddleware), чтобы увидеть свою запись
+# раньше, чем она доедет до реплик.
+
+_state = local()
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+@contextmanager
+def replica_reads():
+    """Разрешает чтение с реплик внутри блока."""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def start_request():
+    _state.wrote = False
+
+
+def request_wrote():
+    """Писал ли текущий запрос в основную базу."""
+    return getattr(_state, 'wrote', False)
+
+
+def reading_replica():
+    """Идёт ли сейчас чтение с реплик."""
+    return bool(
+        settings.REPLICA_DATABASES
+        and getattr(_state, 'replica', False)
+        and not request_wrote()
+    )
+
+
+def is_sticky(request):
+    return settings.REPLICA_STICKY_COOKIE in request.COOKIES
+
+
+def use_replica(view):
+    """Декоратор представления, которое только читает данные."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or is_sticky(request):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_replica():
+            return random.choice(settings.REPLICA_DATABASES)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.page_cache import punch
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """Место страницы, которое рисуется для каждого посетителя отдельно."""
+    return mark_safe(punch(context.get('request'), name, params))
@@ -0,0 +1,52 @@
+from django import template
+from django.conf import settings
+from django.core.cache.utils import make_template_fragment_key
+
+from core.cache import get_or_compute
+
+register = template.Library()
+
+
+class SWRCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        try:
+            expire_time = int(self.expire_time.resolve(context))
+        except (template.VariableDoesNotExist, TypeError, ValueError):
+            raise template.TemplateSyntaxError(
+                f'{{% swrcache %}}: неверное время жизни {self.expire_time}')
+        key = make_template_fragment_key(
+            self.fragment_name, [var.resolve(context) for var in self.vary_on])
+        return get_or_compute(
+            key,
+            lambda: self.nodelist.render(context),
+            expire_time,
+            settings.FRAGMENT_STALE_TTL,
+        )
+
+
+@register.tag
+def swrcache(parser, token):
+    """Как {% cache %}, но пересчёт фрагмента идёт одним запросом.
+
+    {% swrcache ttl имя [переменные...] %} ... {% endswrcache %}
+    Устаревший фрагмент ещё FRAGMENT_STALE_TTL секунд отдаётся остальным
+    запросам, пока один из них рисует новый.
+    """
+    nodelist = parser.parse(('endswrcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ждёт хотя бы два аргумента')
+    return SWRCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -0,0 +1,117 @@
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+# Бюджеты запросов к базе для тестов представлений. Бюджет задаётся на имя
+# URL и проверяется при нескольких размерах страницы, а проверка
+# постоянства ловит N+1: число запросов не должно зависеть ни от размера
+# страницы, ни от объёма данных. Планы запросов (EXPLAIN) показывают,
+# читается ли страница по индексу или база сортирует строки сама.
+
+# Признак сортировки в плане запроса для каждой СУБД.
+SORT_MARKERS = {
+    'sqlite': 'USE TEMP B-TREE FOR',
+    'postgresql': 'Sort',
+    'mysql': 'Using filesort',
+}
+
+
+def explain(sql, using='default'):
+    """План выполнения запроса одной строкой на шаг."""
+    database = connections[using]
+    prefix = 'EXPLAIN QUERY PLAN' if database.vendor == 'sqlite' else (
+        'EXPLAIN')
+    with database.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}')
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def sorting_queries(queries, using='default'):
+    """Пары (SQL, план) для запросов, которые сортируют строки."""
+    marker = SORT_MARKERS.get(connections[using].vendor)
+    if marker is None:
+        return []
+    result = []
+    for query in queries:
+        sql = query['sql']
+        if not sql.startswith('SELECT') or 'ORDER BY' not in sql:
+            continue
+        plan = explain(sql, using)
+        if marker in plan:
+            result.append((sql, plan))
+    return result
+
+
+class QueryBudgetMixin:
+    """Примесь к TestCase с проверками числа запросов страниц.
+
+    query_budgets - словарь «имя URL: наибольшее число запросов»,
+    page_sizes - размеры страницы (POST_COUNT), при которых он проверяется.
+    Кэш перед каждым замером очищается, поэтому меряется худший случай.
+    assertNoSort проверяет по планам запросов, что страница не сортирует
+    строки в базе.
+    """
+
+    query_budgets = {}
+    page_sizes = (1, 10, 50)
+
+    def capture_queries(self, url, data=None, client=None):
+        """Запросы к базе, выполненные при открытии страницы."""
+        client = client or self.client
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, data)
+        self.assertEqual(
+            response.status_code, 200, f'{url} ответил {response.status_code}')
+        return context.captured_queries
+
+    def count_queries(self, url, data=None, client=None):
+        return len(self.capture_queries(url, data, client))
+
+    def assertQueryBudget(self, name, url, data=None, client=None):
+        """Страница укладывается в бюджет при каждом размере страницы."""
+        budget = self.query_budgets[name]
+        for page_size in self.page_sizes:
+            with override_settings(POST_COUNT=page_size):
+                queries = self.capture_queries(url, data, client)
+            if len(queries) > budget:
+                listing = '\n'.join(
+                    f'{number}. {query["sql"]}'
+                    for number, query in enumerate(queries, start=1)
+                )
+                self.fail(
+                    f'{name}: {len(queries)} запросов при POST_COUNT='
+                    f'{page_size}, бюджет {budget}\n{listing}'
+                )
+
+    def assertConstantQueries(self, url, grow, data=None, client=None):
+        """Число запросов не растёт с размером страницы и объёмом данных.
+
+        grow - функция без аргументов, добавляющая данных на странице.
+        """
+        counts = {}
+        for page_size in self.page_sizes:
+            with override_settings(POST_COUNT=page_size):
+                counts[page_size] = self.count_queries(url, data, client)
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'{url}: число запросов зависит от размера страницы: {counts}',
+        )
+        before = counts[self.page_sizes[-1]]
+        grow()
+        with override_settings(POST_COUNT=self.page_sizes[-1]):
+            after = self.count_queries(url, data, client)
+        self.assertEqual(
+            before, after,
+            f'{url}: число запросов выросло с {before} до {after} '
+            f'вместе с данными',
+        )
+
+    def assertNoSort(self, url, data=None, client=None):
+        """Запросы страницы с ORDER BY читают строки по индексу."""
+        sorting = sorting_queries(self.capture_queries(url, data, client))
+        if sorting:
+            listing = '\n\n'.join(
+                f'{sql}\n{plan}' for sql, plan in sorting)
+            self.fail(f'{url}: запросы сортируют строки:\n{listing}')
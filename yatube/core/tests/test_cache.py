@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import acquire_lock, get_or_compute, release_lock
+
+
+class Compute:
+    """Считает вызовы и отдаёт очередное значение."""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.values.pop(0)
+
+
+@override_settings(SINGLE_FLIGHT_WAIT=1, SINGLE_FLIGHT_POLL=0.01)
+class GetOrComputeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fresh_value_not_recomputed(self):
+        compute = Compute('первое', 'второе')
+        self.assertEqual(get_or_compute('key', compute, 60), 'первое')
+        self.assertEqual(get_or_compute('key', compute, 60), 'первое')
+        self.assertEqual(compute.calls, 1)
+
+    def test_stale_value_while_other_recomputes(self):
+        """Пока ключ пересчитывает другой запрос, отдаётся старое значение."""
+        get_or_compute('key', Compute('старое'), 0, stale_ttl=60)
+        token = acquire_lock('lock:key', 60)
+        compute = Compute('новое')
+        self.assertEqual(get_or_compute('key', compute, 60), 'старое')
+        self.assertEqual(compute.calls, 0)
+        release_lock('lock:key', token)
+        self.assertEqual(get_or_compute('key', compute, 60), 'новое')
+
+    def test_miss_waits_for_other_request(self):
+        """При промахе запрос ждёт результата того, кто держит блокировку."""
+        acquire_lock('lock:key', 60)
+        compute = Compute('своё')
+
+        def other_finishes(seconds):
+            cache.set('key', (float('inf'), 'чужое'))
+
+        with mock.patch('core.cache.time.sleep', side_effect=other_finishes):
+            self.assertEqual(get_or_compute('key', compute, 60), 'чужое')
+        self.assertEqual(compute.calls, 0)
+
+    def test_stale_value_on_failure(self):
+        get_or_compute('key', Compute('старое'), 0, stale_ttl=60)
+
+        def broken():
+            raise ValueError('база недоступна')
+
+        with self.assertLogs('core.cache', 'ERROR'):
+            self.assertEqual(get_or_compute('key', broken, 60), 'старое')
+        self.assertIsNone(cache.get('lock:key'))
+
+    def test_cache_if(self):
+        compute = Compute(None, 'значение')
+        get_or_compute('key', compute, 60, cache_if=bool)
+        self.assertEqual(
+            get_or_compute('key', compute, 60, cache_if=bool), 'значение')
+        self.assertEqual(compute.calls, 2)
+
+
+class SWRCacheTagTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fragment_rendered_once(self):
+        template = Template(
+            '{% load swr_cache %}'
+            '{% swrcache 60 counter name %}{{ compute }}{% endswrcache %}'
+        )
+        compute = Compute('раз', 'два')
+        first = template.render(Context({'compute': compute, 'name': 'a'}))
+        second = template.render(Context({'compute': compute, 'name': 'a'}))
+        self.assertEqual((first, second), ('раз', 'раз'))
+        self.assertEqual(compute.calls, 1)
@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.cache_backends import MetricsCache, TieredCache
+from yatube.settings import cache_from_env
+
+
+def tiered(l1_location):
+    """Кэш «процесса» l1_location над общим LocMemCache."""
+    return TieredCache('shared', {
+        'KEY_PREFIX': 'test',
+        'OPTIONS': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'L1_TIMEOUT': 60,
+            'L1_LOCATION': l1_location,
+        },
+    })
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.first = tiered('first')
+        self.second = tiered('second')
+        self.addCleanup(self.first.clear)
+        self.addCleanup(self.second.clear)
+
+    def test_value_shared_between_processes(self):
+        """Записанное одним процессом читается другим через L2."""
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.l1.get('key'), 'value')
+
+    def test_l1_serves_reads(self):
+        """Повторное чтение не ходит в общий кэш."""
+        self.first.set('key', 'value')
+        with mock.patch.object(self.first.l2, 'get') as shared_get:
+            self.assertEqual(self.first.get('key'), 'value')
+        shared_get.assert_not_called()
+
+    def test_misses_not_cached(self):
+        """Промах не запоминается в L1."""
+        self.assertIsNone(self.first.get('key'))
+        self.second.set('key', 'value')
+        self.assertEqual(self.first.get('key'), 'value')
+
+    def test_incr_goes_to_shared_cache(self):
+        """incr считает в L2 и сбрасывает L1."""
+        self.first.set('counter', 1)
+        self.second.get('counter')
+        self.assertEqual(self.first.incr('counter'), 2)
+        self.assertEqual(self.second.incr('counter'), 3)
+        self.assertEqual(self.first.get('counter'), 3)
+
+    def test_add_is_atomic_in_shared_cache(self):
+        """add решает по L2, а не по памяти процесса."""
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 1))
+
+    def test_delete_clears_both_tiers(self):
+        self.first.set('key', 'value')
+        self.first.delete('key')
+        self.assertIsNone(self.first.l1.get('key'))
+        self.assertIsNone(self.second.get('key'))
+
+
+class CacheSettingsTest(SimpleTestCase):
+    def test_locmem_by_default(self):
+        """Без переменных окружения кэш локальный и без L1."""
+        with mock.patch.dict('os.environ', {}, clear=True):
+            config = cache_from_env()
+        self.assertEqual(config['BACKEND'], 'core.cache_backends.MetricsCache')
+        self.assertEqual(
+            config['OPTIONS']['BACKEND'],
+            'django.core.cache.backends.locmem.LocMemCache',
+        )
+        self.assertEqual(config['KEY_PREFIX'], 'yatube')
+
+    def test_redis_with_l1_from_env(self):
+        """Redis с памятью процесса настраивается переменными окружения."""
+        environ = {
+            'CACHE_BACKEND': 'redis',
+            'CACHE_LOCATION': 'redis://cache:6379/0',
+            'CACHE_KEY_PREFIX': 'prod',
+            'CACHE_VERSION': '3',
+            'CACHE_L1_TIMEOUT': '5',
+        }
+        with mock.patch.dict('os.environ', environ, clear=True):
+            config = cache_from_env()
+        self.assertEqual(config['LOCATION'], 'redis://cache:6379/0')
+        self.assertEqual(config['KEY_PREFIX'], 'prod')
+        self.assertEqual(config['VERSION'], 3)
+        tiered = config['OPTIONS']
+        self.assertEqual(tiered['BACKEND'], 'core.cache_backends.TieredCache')
+        self.assertEqual(tiered['OPTIONS']['L1_TIMEOUT'], 5)
+        self.assertEqual(
+            tiered['OPTIONS']['BACKEND'], 'django_redis.cache.RedisCache')
+
+    def test_tiered_config_builds(self):
+        """Собранная из окружения конфигурация создаёт рабочий кэш."""
+        with mock.patch.dict(
+                'os.environ', {'CACHE_L1_TIMEOUT': '5'}, clear=True):
+            config = cache_from_env()
+        cache = MetricsCache('settings-test', config)
+        self.addCleanup(cache.clear)
+        self.assertIsInstance(cache.inner, TieredCache)
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
@@ -0,0 +1,140 @@
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from core.db_backends import PoolExhausted
+from yatube.settings import database_from_env
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+@skipUnless(psycopg2, 'psycopg2 не установлен')
+class PoolBackendTest(SimpleTestCase):
+    """Соединения бэкенда postgresql_pool берутся из пула и туда же
+    возвращаются; сам PostgreSQL не нужен, пул подменяется."""
+
+    def setUp(self):
+        from core.db_backends.postgresql_pool import base
+        self.base = base
+        patcher = mock.patch.object(base.pool, 'ThreadedConnectionPool')
+        self.pool_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(base._pools.clear)
+        self.pool = self.pool_class.return_value
+        self.pool.closed = False
+        self.pool.getconn.return_value.closed = 0
+
+    def wrapper(self, **environ):
+        environ = {
+            'DB_ENGINE': 'postgresql_pool', 'DB_POOL_MAX_SIZE': '20',
+            **environ,
+        }
+        with mock.patch.dict('os.environ', environ, clear=True):
+            settings_dict = database_from_env()
+        settings_dict.update(
+            TIME_ZONE=None, AUTOCOMMIT=True, ATOMIC_REQUESTS=False)
+        return self.base.DatabaseWrapper(settings_dict, 'pool-test')
+
+    def test_connection_taken_from_shared_pool(self):
+        """Оба подключения берутся из одного пула процесса, а его
+        параметры не уходят в psycopg2.connect."""
+        first, second = self.wrapper(), self.wrapper()
+        for wrapper in (first, second):
+            params = wrapper.get_connection_params()
+            self.assertEqual(
+                wrapper.get_new_connection(params),
+                self.pool.getconn.return_value,
+            )
+        self.pool_class.assert_called_once()
+        args, kwargs = self.pool_class.call_args
+        self.assertEqual(args, (1, 20))
+        self.assertNotIn('POOL_MAX_SIZE', kwargs)
+        self.assertEqual(kwargs['database'], 'yatube')
+
+    def test_close_returns_connection_to_pool(self):
+        """Закрытие возвращает живое соединение в пул, не разрывая его."""
+        wrapper = self.wrapper()
+        wrapper.connection = wrapper.get_new_connection(
+            wrapper.get_connection_params())
+        wrapper._close()
+        self.pool.putconn.assert_called_once_with(
+            wrapper.connection, close=False)
+
+    def test_broken_connection_closed_by_pool(self):
+        wrapper = self.wrapper()
+        wrapper.connection = wrapper.get_new_connection(
+            wrapper.get_connection_params())
+        wrapper.connection.closed = 2
+        wrapper._close()
+        self.pool.putconn.assert_called_once_with(
+            wrapper.connection, close=True)
+
+    def test_exhausted_pool_waits_then_fails(self):
+        """Занятый пул ждёт свободное соединение, потом PoolExhausted."""
+        self.pool.getconn.side_effect = [
+            self.base.pool.PoolError('connection pool exhausted'),
+            mock.sentinel.connection,
+        ]
+        wrapper = self.wrapper(DB_POOL_TIMEOUT='1')
+        self.assertEqual(
+            wrapper.get_new_connection(wrapper.get_connection_params()),
+            mock.sentinel.connection,
+        )
+        self.pool.getconn.side_effect = self.base.pool.PoolError(
+            'connection pool exhausted')
+        wrapper = self.wrapper(DB_POOL_TIMEOUT='0')
+        with self.assertRaisesMessage(PoolExhausted, '20'):
+            wrapper.get_new_connection(wrapper.get_connection_params())
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'нужен PostgreSQL: DB_ENGINE=postgresql',
+)
+class PoolBackendIntegrationTest(SimpleTestCase):
+    """Пул на настоящем PostgreSQL тестовой базы."""
+
+    def setUp(self):
+        from core.db_backends.postgresql_pool import base
+        self.base = base
+        self.addCleanup(base.close_pools)
+
+    def wrapper(self, alias):
+        settings_dict = {
+            **connection.settings_dict,
+            'ENGINE': 'core.db_backends.postgresql_pool',
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                **connection.settings_dict['OPTIONS'],
+                'POOL_MIN_SIZE': 1,
+                'POOL_MAX_SIZE': 1,
+                'POOL_TIMEOUT': 0,
+            },
+        }
+        wrapper = self.base.DatabaseWrapper(settings_dict, alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_reused_after_close(self):
+        """После close() следующее подключение берёт то же соединение."""
+        wrapper = self.wrapper('pool-integration')
+        pid = self.backend_pid(wrapper)
+        wrapper.close()
+        self.assertEqual(self.backend_pid(wrapper), pid)
+
+    def test_exhausted_pool_raises(self):
+        """Второе подключение к пулу на одно соединение не проходит."""
+        first = self.wrapper('pool-integration')
+        second = self.wrapper('pool-integration')
+        self.backend_pid(first)
+        with self.assertRaises(PoolExhausted):
+            self.backend_pid(second)
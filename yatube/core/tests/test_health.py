@@ -0,0 +1,71 @@
+from http import HTTPStatus
+from unittest import mock
+
+from django.db import DatabaseError, connections
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from yatube.settings import database_from_env, search_backend_from_env
+
+
+class HealthViewTest(TestCase):
+    # Проверка обходит все соединения, включая реплики.
+    databases = '__all__'
+
+    def test_health_ok(self):
+        """Проверка отвечает 200, когда база и кэш доступны."""
+        response = self.client.get(reverse('health'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = response.json()
+        self.assertEqual(data['status'], 'ok')
+        self.assertTrue(data['checks']['database:default']['ok'])
+        self.assertTrue(data['checks']['cache']['ok'])
+
+    def test_health_reports_database_failure(self):
+        """Недоступная база даёт 503, а причина уходит только в лог."""
+        with mock.patch.object(
+            connections['default'], 'cursor',
+            side_effect=DatabaseError('host=db user=yatube'),
+        ), self.assertLogs('core.views', 'ERROR') as logs:
+            response = self.client.get(reverse('health'))
+        self.assertEqual(
+            response.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertEqual(
+            response.json()['checks']['database:default'], {'ok': False})
+        self.assertNotIn('host=db', response.content.decode())
+        self.assertIn('host=db', '\n'.join(logs.output))
+
+
+class DatabaseSettingsTest(SimpleTestCase):
+    def test_sqlite_by_default(self):
+        """Без переменных окружения используется SQLite."""
+        with mock.patch.dict('os.environ', {}, clear=True):
+            database = database_from_env()
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+
+    def test_postgresql_pool_from_env(self):
+        """Пул PostgreSQL настраивается переменными окружения."""
+        environ = {
+            'DB_ENGINE': 'postgresql_pool',
+            'DB_NAME': 'yatube_prod',
+            'DB_HOST': 'db',
+            'DB_POOL_MAX_SIZE': '20',
+        }
+        with mock.patch.dict('os.environ', environ, clear=True):
+            database = database_from_env()
+        self.assertEqual(
+            database['ENGINE'], 'core.db_backends.postgresql_pool')
+        self.assertEqual(database['NAME'], 'yatube_prod')
+        self.assertEqual(database['HOST'], 'db')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['POOL_MAX_SIZE'], 20)
+
+    def test_search_backend_follows_engine(self):
+        """Индекс FTS5 на SQLite, tsvector на PostgreSQL."""
+        environ = {'DB_ENGINE': 'postgresql'}
+        with mock.patch.dict('os.environ', environ, clear=True):
+            backend = search_backend_from_env(database_from_env())
+        self.assertEqual(backend, 'posts.search.PostgresSearchBackend')
+        with mock.patch.dict('os.environ', {}, clear=True):
+            backend = search_backend_from_env(database_from_env())
+        self.assertEqual(backend, 'posts.search.SQLiteFTSBackend')
@@ -0,0 +1,95 @@
+from http import HTTPStatus
+
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.metrics import CACHE_REQUESTS, REQUEST_LATENCY, Histogram, Registry
+
+User = get_user_model()
+
+
+class MetricsRegistryTest(TestCase):
+    def test_histogram_text_format(self):
+        """Гистограмма выводится накопленными корзинами, суммой и числом."""
+        registry = Registry()
+        latency = registry.register(
+            Histogram('latency', 'Время.', ('view',), buckets=(0.1, 1)))
+        latency.labels('index').observe(0.05)
+        latency.labels('index').observe(0.5)
+        latency.labels('index').observe(5)
+        text = registry.render()
+        for line in (
+            '# TYPE latency histogram',
+            'latency_bucket{view="index",le="0.1"} 1',
+            'latency_bucket{view="index",le="1"} 2',
+            'latency_bucket{view="index",le="+Inf"} 3',
+            'latency_sum{view="index"} 5.55',
+            'latency_count{view="index"} 3',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text.splitlines())
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_request_latency_recorded(self):
+        """Запрос к странице попадает в гистограмму по имени URL."""
+        child = REQUEST_LATENCY.labels('posts:index', 'GET', 200)
+        before = child.get()[2]
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(child.get()[2], before + 1)
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn(
+            'yatube_http_request_duration_seconds_count{view="posts:index",'
+            'method="GET",status="200"}',
+            response.content.decode(),
+        )
+
+    def test_fragment_cache_hits_counted(self):
+        """Фрагменты {% cache %} считаются отдельно от прочих ключей."""
+        hits = CACHE_REQUESTS.labels('default', 'fragment', 'hit')
+        misses = CACHE_REQUESTS.labels('default', 'fragment', 'miss')
+        hits_before, misses_before = hits.get(), misses.get()
+        self.client.get(reverse('posts:index'))
+        self.assertGreater(misses.get(), misses_before)
+        # Другая страница минует кэш страниц, но не кэш фрагментов.
+        self.client.get(reverse('posts:index'), {'page': '2'})
+        self.assertGreater(hits.get(), hits_before)
+
+    def test_metrics_hidden_from_other_addresses(self):
+        """Посторонним адресам метрики не отдаются."""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_metrics_closed_for_localhost_by_default(self):
+        """Без настроек запрос с прокси на 127.0.0.1 не пускается."""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_metrics_for_allowed_address(self):
+        """Адрес из списка получает метрики без входа."""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_bearer_token(self):
+        """Метрики отдаются по верному токену Prometheus."""
+        url = reverse('metrics')
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for header in ('Bearer wrong', 'secret', ''):
+            with self.subTest(header=header):
+                response = self.client.get(url, HTTP_AUTHORIZATION=header)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_FOUND)
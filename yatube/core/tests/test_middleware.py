@@ -0,0 +1,87 @@
+from http import HTTPStatus
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.db_backends import PoolExhausted
+from core.middleware import registry
+
+User = get_user_model()
+
+
+class RequestStatsMiddlewareTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+
+    def test_server_timing_header(self):
+        """Сотрудник видит время SQL, шаблонов и представления."""
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for metric in ('sql;dur=', 'render;dur=', 'view;dur=', 'total;dur='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+
+    def test_server_timing_hidden_from_visitors(self):
+        """Гостю и обычному пользователю заголовок не отдаётся."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        user = User.objects.create_user(username='reader')
+        self.client.force_login(user)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_in_debug(self):
+        """При DEBUG заголовок отдаётся всем."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn('Server-Timing', response)
+
+    def test_stats_collected_by_url_name(self):
+        """Статистика копится по имени URL."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        stats = registry.snapshot()['posts:index']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['avg_queries'], 0)
+        self.assertGreater(stats['avg_render_time_ms'], 0)
+
+    @override_settings(REQUEST_STATS_MAX_QUERIES=0)
+    def test_query_heavy_request_logged(self):
+        """Запрос с лишними обращениями к базе попадает в лог."""
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('posts:index', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_stats_view_for_staff_only(self):
+        """Статистику видят только администраторы."""
+        url = reverse('request_stats')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(admin)
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('posts:index', response.json())
+
+
+class DatabaseBusyMiddlewareTest(TestCase):
+    def test_pool_exhausted_gives_503(self):
+        """Занятый пул соединений даёт 503 с Retry-After, а не 500."""
+        cache.clear()
+        with mock.patch.object(
+            connections['default'], 'cursor',
+            side_effect=PoolExhausted('Все 10 соединений пула заняты'),
+        ), self.assertLogs('core.middleware', 'WARNING'):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
@@ -0,0 +1,73 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.routers import replica_reads, start_request
+from posts.models import Post, User
+
+
+@skipUnless(
+    'replica' in settings.DATABASES,
+    'нужна реплика: --settings=yatube.test_settings',
+)
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+    """Реплика в тестах - зеркало default, и запросы к ней видны
+    в её собственном соединении."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.user, text='Тестовый пост')
+        self.client.force_login(self.user)
+
+    def replica_queries(self):
+        return CaptureQueriesContext(connections['replica'])
+
+    def test_router_decisions(self):
+        """Реплика используется внутри replica_reads и до первой записи."""
+        start_request()
+        with self.replica_queries() as before_write:
+            with replica_reads():
+                self.assertTrue(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(len(before_write), 1)
+        with self.replica_queries() as after_write:
+            with replica_reads():
+                Post.objects.filter(pk=self.post.pk).update(text='Правка')
+                self.assertEqual(
+                    Post.objects.get(pk=self.post.pk).text, 'Правка')
+            Post.objects.get(pk=self.post.pk)
+        self.assertEqual(len(after_write), 0)
+
+    def test_read_views_use_replica(self):
+        """Страницы лент читают с реплики."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:follow_index'),
+        )
+        for url in pages:
+            with self.subTest(url=url), self.replica_queries() as queries:
+                self.client.get(url)
+            self.assertTrue(queries.captured_queries)
+
+    def test_reads_after_write_go_to_primary(self):
+        """После записи пользователь какое-то время читает из основной базы."""
+        response = self.client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        with self.replica_queries() as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, 'Комментарий')
+        self.assertEqual(len(queries), 0)
@@ -0,0 +1,28 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core.signals import apply_sqlite_pragmas
+
+
+class SQLitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_connection(self):
+        """Прагмы из настроек выставляются соединению."""
+        default = self.pragma('cache_size')
+        with override_settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+            apply_sqlite_pragmas(sender=None, connection=connection)
+            self.assertEqual(self.pragma('cache_size'), -1234)
+        # Возвращаем размер кэша для остальных тестов.
+        with override_settings(SQLITE_PRAGMAS={'cache_size': default}):
+            apply_sqlite_pragmas(sender=None, connection=connection)
+
+    @override_settings(SQLITE_PRAGMAS={})
+    def test_no_pragmas_by_default(self):
+        """Без профиля соединение не меняется."""
+        default = self.pragma('cache_size')
+        apply_sqlite_pragmas(sender=None, connection=connection)
+        self.assertEqual(self.pragma('cache_size'), default)
@@ -1,4 +1,18 @@
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics
+from .middleware import registry
+
+logger = logging.getLogger(__name__)
 
 
 def permission_denied(request, exception):
@@ -17,3 +31,72 @@ def page_not_found(request, exception):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+@staff_member_required
+def request_stats(request):
+    """Статистика запросов по именам URL для администраторов."""
+    return JsonResponse(registry.snapshot())
+
+
+def _metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(authorization, f'Bearer {token}'):
+        return True
+    return (
+        request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+        or request.user.is_staff
+    )
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus.
+
+    Реестр живёт в памяти процесса: при нескольких воркерах каждый
+    отдаёт только свои счётчики, и Prometheus должен опрашивать
+    каждый процесс отдельно (или складывать ряды по метке instance).
+    """
+    if not _metrics_allowed(request):
+        raise Http404
+    return HttpResponse(
+        metrics.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def health(request):
+    """Проверка баз данных и кэша для балансировщика и мониторинга.
+
+    Адрес открыт всем, поэтому причины сбоев только пишутся в лог:
+    в тексте ошибки базы бывают хост и имя пользователя.
+    """
+    checks = {}
+    healthy = True
+    for alias in connections:
+        start = perf_counter()
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except DatabaseError:
+            logger.exception('База %s не отвечает', alias)
+            healthy = False
+            checks[f'database:{alias}'] = {'ok': False}
+        else:
+            checks[f'database:{alias}'] = {
+                'ok': True,
+                'latency_ms': round((perf_counter() - start) * 1000, 2),
+            }
+    try:
+        cache.set('health-check', True, 10)
+        cache_ok = cache.get('health-check') is True
+    except Exception:
+        logger.exception('Кэш не отвечает')
+        cache_ok = False
+    checks['cache'] = {'ok': cache_ok}
+    healthy = healthy and cache_ok
+    return JsonResponse(
+        {'status': 'ok' if healthy else 'error', 'checks': checks},
+        status=200 if healthy else 503,
+    )
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 
 from .models import Follow, Group, Post, Comment
+from .search import backend as search_backend
 
 
 @admin.register(Post)
@@ -18,6 +20,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     empty_value_display = ('-пусто-')
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        ids = search_backend.search(search_term, settings.SEARCH_MAX_RESULTS)
+        return queryset.filter(pk__in=ids), False
+
 
 admin.site.register(Group)
 
@@ -0,0 +1,70 @@
+import json
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from django.core.files.storage import default_storage
+
+from .transfer import export_rows
+
+# Архив постов пользователя отдаётся потоком: ZipFile пишет в объект,
+# который лишь копит байты до следующей отдачи клиенту, а записи и файлы
+# читаются порциями. В памяти одновременно лежит не больше одной порции.
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Buffer:
+    """Поток только для записи, из которого забирают накопленные байты."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def user_rows(user):
+    """Посты и комментарии пользователя в формате export_posts."""
+    for row in export_rows('post', author=user):
+        yield {'model': 'post', **row}
+    for row in export_rows('comment', author=user):
+        yield {'model': 'comment', **row}
+
+
+def stream_ndjson(user):
+    for row in user_rows(user):
+        yield (json.dumps(row, ensure_ascii=False) + '\n').encode()
+
+
+def stream_zip(user):
+    """ZIP с data.ndjson и картинками постов, отдаваемый по частям."""
+    return filter(None, _zip_chunks(user))
+
+
+def _zip_chunks(user):
+    buffer = _Buffer()
+    with ZipFile(buffer, 'w', compression=ZIP_DEFLATED) as archive:
+        with archive.open('data.ndjson', 'w', force_zip64=True) as file:
+            for line in stream_ndjson(user):
+                file.write(line)
+                yield buffer.take()
+        images = user.posts.exclude(image='').order_by('image').values_list(
+            'image', flat=True).distinct()
+        for name in images.iterator():
+            if not default_storage.exists(name):
+                continue
+            with default_storage.open(name) as source, archive.open(
+                name, 'w', force_zip64=True,
+            ) as file:
+                for chunk in source.chunks(CHUNK_SIZE):
+                    file.write(chunk)
+                    yield buffer.take()
+    yield buffer.take()
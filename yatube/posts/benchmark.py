@@ -0,0 +1,237 @@
+import random
+import time
+from statistics import mean
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.cache import bump_versions
+from core.testing import sorting_queries
+
+from . import feed
+from .counters import reconcile
+from .models import Comment, Follow, Group, Post, User
+from .search import backend
+
+# Нагрузочный прогон горячих страниц: база заполняется заданными объёмами
+# данных, затем каждая страница запрашивается через тестовый клиент Django,
+# а время ответа и число запросов к базе сводятся в отчёт, который удобно
+# сравнивать между релизами.
+
+ENDPOINTS = (
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+)
+
+
+def seed(users=100, groups=10, posts=2000, comments=5000, follows=1000,
+         random_seed=0):
+    """Заполняет базу данными для прогона и возвращает их объёмы.
+
+    Записи создаются через bulk_create, поэтому счётчики, ленты и
+    поисковый индекс потом пересчитываются целиком.
+    """
+    rng = random.Random(random_seed)
+    User.objects.bulk_create(
+        User(username=f'bench_{number}') for number in range(users))
+    user_ids = list(User.objects.filter(
+        username__startswith='bench_').values_list('pk', flat=True))
+    Group.objects.bulk_create(
+        (
+            Group(
+                title=f'Группа {number}',
+                slug=f'bench-{number}',
+                description='Группа для нагрузочного прогона',
+            )
+            for number in range(groups)
+        ),
+    )
+    group_ids = list(Group.objects.filter(
+        slug__startswith='bench-').values_list('pk', flat=True))
+    Post.objects.bulk_create(
+        (
+            Post(
+                text=f'Пост номер {number} для нагрузочного прогона',
+                author_id=rng.choice(user_ids),
+                group_id=rng.choice(group_ids + [None]),
+            )
+            for number in range(posts)
+        ),
+    )
+    post_ids = list(Post.objects.filter(
+        author_id__in=user_ids).values_list('pk', flat=True))
+    Comment.objects.bulk_create(
+        (
+            Comment(
+                post_id=rng.choice(post_ids),
+                author_id=rng.choice(user_ids),
+                text=f'Комментарий {number}',
+            )
+            for number in range(comments)
+        ),
+    )
+    pairs = set()
+    limit = min(follows, len(user_ids) * (len(user_ids) - 1))
+    while len(pairs) < limit:
+        user_id, author_id = rng.sample(user_ids, 2)
+        pairs.add((user_id, author_id))
+    Follow.objects.bulk_create(
+        (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        ),
+    )
+    reconcile()
+    feed.rebuild()
+    backend.rebuild()
+    bump_versions(
+        ('index',),
+        *(('group', group_id) for group_id in group_ids),
+        *(('author', user_id) for user_id in user_ids),
+    )
+    return {
+        'users': len(user_ids),
+        'groups': len(group_ids),
+        'posts': len(post_ids),
+        'comments': comments,
+        'follows': len(pairs),
+    }
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = round(percent / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+def measure(client, url, requests=50, warmup=5):
+    """Время ответа, число запросов и запросы с сортировкой в базе."""
+    # Первый запрос после seed() идёт мимо кэша фрагментов, по нему
+    # и проверяются планы запросов.
+    with CaptureQueriesContext(connection) as context:
+        client.get(url)
+    sorting = sorting_queries(context.captured_queries)
+    for _ in range(warmup):
+        client.get(url)
+    timings = []
+    queries = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(
+                f'{url} ответил кодом {response.status_code}')
+        queries.append(len(context.captured_queries))
+    elapsed = time.perf_counter() - started
+    return {
+        'url': url,
+        'requests': requests,
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': round(_percentile(timings, 50) * 1000, 2),
+        'p99_ms': round(_percentile(timings, 99) * 1000, 2),
+        'mean_ms': round(mean(timings) * 1000, 2),
+        'queries_p50': _percentile(queries, 50),
+        'queries_max': max(queries),
+        'sorting_queries': [sql for sql, plan in sorting],
+    }
+
+
+def _urls():
+    """Адреса страниц с самыми «тяжёлыми» объектами из базы."""
+    group = Group.objects.annotate(
+        total=Count('groups')).order_by('-total').first()
+    author = User.objects.order_by('-counters__posts_count').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    reader = User.objects.order_by('-counters__following_count').first()
+    return reader, {
+        'index': reverse('posts:index'),
+        'group_posts': reverse('posts:group_list', args=(group.slug,)),
+        'profile': reverse('posts:profile', args=(author.username,)),
+        'post_detail': reverse('posts:post_detail', args=(post.pk,)),
+        'follow_index': reverse('posts:follow_index'),
+    }
+
+
+def run(requests=50, warmup=5, endpoints=ENDPOINTS):
+    """Прогоняет страницы и возвращает отчёт."""
+    reader, urls = _urls()
+    client = Client()
+    client.force_login(reader)
+    return {
+        'page_size': settings.POST_COUNT,
+        'endpoints': {
+            name: measure(client, urls[name], requests, warmup)
+            for name in endpoints
+        },
+    }
+
+
+def concurrent_load(duration=5.0, readers=4, writers=1):
+    """Чтение главной ленты и запись комментариев из нескольких потоков.
+
+    Каждый поток работает через своё соединение, как отдельный воркер.
+    Ошибки блокировки базы считаются, а не прерывают прогон.
+    """
+    post_id, author_id = Post.objects.values_list(
+        'pk', 'author_id').order_by('-pk')[0]
+    reads, writes = [], []
+    errors = {'read': 0, 'write': 0}
+    lock = Lock()
+    deadline = time.perf_counter() + duration
+
+    def read():
+        list(Post.objects.select_related(
+            'author', 'group')[:settings.POST_COUNT])
+
+    def write():
+        Comment.objects.create(
+            post_id=post_id, author_id=author_id, text='Комментарий')
+
+    def worker(action, timings, kind):
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    action()
+                except OperationalError:
+                    with lock:
+                        errors[kind] += 1
+                    continue
+                timings.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    threads = [
+        Thread(target=worker, args=(read, reads, 'read'))
+        for _ in range(readers)
+    ] + [
+        Thread(target=worker, args=(write, writes, 'write'))
+        for _ in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'reads_per_second': round(len(reads) / duration, 1),
+        'writes_per_second': round(len(writes) / duration, 1),
+        'read_p50_ms': _milliseconds(reads, 50),
+        'read_p99_ms': _milliseconds(reads, 99),
+        'write_p50_ms': _milliseconds(writes, 50),
+        'write_p99_ms': _milliseconds(writes, 99),
+        'read_errors': errors['read'],
+        'write_errors': errors['write'],
+    }
+
+
+def _milliseconds(timings, percent):
+    if not timings:
+        return None
+    return round(_percentile(timings, percent) * 1000, 2)
@@ -0,0 +1,82 @@
+from collections import defaultdict
+
+from django.db.models import OuterRef, Q, Subquery
+
+from core.paginator import CursorPaginator, LazyRows
+
+from .models import Comment
+
+# Комментарии под постом листаются ветками: страница - это комментарии
+# верхнего уровня по курсору, а ответы в ветках страницы читаются
+# следующим запросом, упорядоченным по материализованному пути. Ветка
+# показывает не больше COMMENT_REPLIES ответов, остальные подгружаются
+# фрагментом post_comments с курсором по path.
+
+
+def replies_cutoff(limit):
+    """Путь первого ответа ветки, который уже не показывается сразу."""
+    return Subquery(
+        Comment.objects.filter(root_id=OuterRef('pk')).order_by(
+            'path').values('path')[limit:limit + 1])
+
+
+def attach_replies(roots):
+    """Раскладывает ответы по веткам в root.loaded_replies одним запросом.
+
+    У каждой ветки должен быть replies_cutoff (см. replies_cutoff): ответы
+    с этого пути не читаются, а root.more_replies получает путь последнего
+    показанного ответа, с которого продолжит reply_page.
+    """
+    threads = defaultdict(list)
+    if roots:
+        condition = Q()
+        for root in roots:
+            if root.replies_cutoff is None:
+                condition |= Q(root_id=root.pk)
+            else:
+                condition |= Q(root_id=root.pk, path__lt=root.replies_cutoff)
+        replies = Comment.objects.select_related('author').filter(
+            condition).order_by('root_id', 'path')
+        for reply in replies:
+            threads[reply.root_id].append(reply)
+    for root in roots:
+        root.loaded_replies = threads[root.pk]
+        root.more_replies = (
+            root.loaded_replies[-1].path
+            if root.replies_cutoff and root.loaded_replies else None
+        )
+    return roots
+
+
+def reply_page(post_id, root_id, after, limit):
+    """Следующие limit ответов ветки поста после пути after.
+
+    Возвращает ответы и путь, с которого продолжать, или None.
+    """
+    replies = list(Comment.objects.select_related('author').filter(
+        post_id=post_id, root_id=root_id, path__gt=after,
+    ).order_by('path')[:limit + 1])
+    more = replies[limit - 1].path if len(replies) > limit else None
+    return replies[:limit], more
+
+
+class ThreadPaginator(CursorPaginator):
+    """Курсорные страницы веток комментариев поста, от новых к старым."""
+
+    def __init__(self, post_id, per_page, replies_per_thread):
+        super().__init__(
+            Comment.objects.select_related('author').filter(
+                post_id=post_id, parent__isnull=True,
+            ).annotate(replies_cutoff=replies_cutoff(replies_per_thread)),
+            per_page,
+        )
+        self._threads = None
+
+    def _get_page(self, rows, number, paginator):
+        return super()._get_page(
+            LazyRows(lambda: self.threads(rows)), number, paginator)
+
+    def threads(self, rows):
+        if self._threads is None:
+            self._threads = attach_replies(list(rows))
+        return self._threads
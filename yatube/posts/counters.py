@@ -0,0 +1,103 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserCounters
+
+# Счётчики меняются обработчиками сигналов внутри транзакции сохранения
+# (см. core.models.AtomicSaveModel), а удаление через Collector Django и так
+# выполняет в транзакции. Расхождения исправляет команда recount_counters.
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.order_by().values(field).annotate(
+            total=Count('pk')).values('total')
+    ), Value(0))
+
+
+def actual_user_counts():
+    """Выражения с настоящими значениями счётчиков пользователя."""
+    return {
+        'posts_count': _count(
+            Post.objects.filter(author_id=OuterRef('user_id')), 'author_id'),
+        'followers_count': _count(
+            Follow.objects.filter(author_id=OuterRef('user_id')), 'author_id'),
+        'following_count': _count(
+            Follow.objects.filter(user_id=OuterRef('user_id')), 'user_id'),
+    }
+
+
+def actual_comments_count():
+    return _count(Comment.objects.filter(post_id=OuterRef('pk')), 'post_id')
+
+
+def _shift(field, delta):
+    # Счётчик мог разойтись с данными (импорт, --no-rebuild) и уже стоять
+    # на нуле: уменьшение не должно уводить его в минус и ронять удаление.
+    return Greatest(F(field) + delta, Value(0))
+
+
+def change_user(user_id, **deltas):
+    UserCounters.objects.filter(user_id=user_id).update(
+        **{field: _shift(field, delta) for field, delta in deltas.items()})
+
+
+def change_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift('comments_count', delta))
+
+
+def reconcile(user_ids=None, post_ids=None):
+    """Исправляет разошедшиеся счётчики и возвращает число исправлений.
+
+    user_ids и post_ids ограничивают проверку этими пользователями
+    и постами; None - проверить все.
+    """
+    for users in _scoped(User.objects.all(), 'pk', user_ids):
+        UserCounters.objects.bulk_create(
+            (
+                UserCounters(user_id=user_id)
+                for user_id in users.filter(
+                    counters__isnull=True).values_list('pk', flat=True)
+            ),
+            ignore_conflicts=True,
+        )
+    fixed = 0
+    for counters in _scoped(UserCounters.objects.all(), 'user_id', user_ids):
+        users = counters.annotate(
+            **{f'actual_{name}': value
+               for name, value in actual_user_counts().items()}
+        ).filter(
+            ~Q(posts_count=F('actual_posts_count'))
+            | ~Q(followers_count=F('actual_followers_count'))
+            | ~Q(following_count=F('actual_following_count'))
+        )
+        fixed += _update_by_pk(
+            UserCounters, users.values_list('pk', flat=True),
+            **actual_user_counts())
+    for posts in _scoped(Post.objects.all(), 'pk', post_ids):
+        posts = posts.annotate(actual=actual_comments_count()).exclude(
+            comments_count=F('actual'))
+        fixed += _update_by_pk(
+            Post, posts.values_list('pk', flat=True),
+            comments_count=actual_comments_count())
+    return fixed
+
+
+def _scoped(queryset, field, ids, batch_size=500):
+    """Выборка целиком или пачками по id, чтобы IN не разрастался."""
+    if ids is None:
+        yield queryset
+        return
+    ids = sorted(ids)
+    for start in range(0, len(ids), batch_size):
+        yield queryset.filter(
+            **{f'{field}__in': ids[start:start + batch_size]})
+
+
+def _update_by_pk(model, pks, batch_size=500, **values):
+    pks = list(pks)
+    for start in range(0, len(pks), batch_size):
+        model.objects.filter(
+            pk__in=pks[start:start + batch_size]).update(**values)
+    return len(pks)
@@ -0,0 +1,195 @@
+from heapq import merge
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from core.paginator import CursorPaginator
+
+from .models import FeedEntry, Follow, Post, UserCounters
+
+# Лента подписок гибридная: посты обычных авторов раскладываются по лентам
+# подписчиков при публикации (push), а посты авторов, у которых не меньше
+# FEED_CELEBRITY_FOLLOWERS подписчиков, подмешиваются при чтении (pull).
+# Назад к раскладке автор возвращается, только потеряв ещё
+# FEED_CELEBRITY_HYSTERESIS подписчиков: пока он держится у порога, каждая
+# отписка не раскладывает его посты по лентам заново. Что автор уже
+# перешёл в pull, помнит UserCounters.feed_pulled.
+
+
+def pulled(prefix=''):
+    """Условие на UserCounters: посты автора подмешиваются при чтении."""
+    threshold = settings.FEED_CELEBRITY_FOLLOWERS
+    return Q(**{f'{prefix}followers_count__gte': threshold}) | Q(**{
+        f'{prefix}feed_pulled': True,
+        f'{prefix}followers_count__gte': (
+            threshold - settings.FEED_CELEBRITY_HYSTERESIS),
+    })
+
+
+def is_celebrity(author_id):
+    return UserCounters.objects.filter(
+        pulled(), user_id=author_id).exists()
+
+
+def mark_pulled(author_id):
+    """Запоминает, что автор набрал порог подписчиков."""
+    UserCounters.objects.filter(
+        user_id=author_id,
+        feed_pulled=False,
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).update(feed_pulled=True)
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post=post, created=post.created)
+            for user_id in followers.iterator()
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту новые посты автора после подписки."""
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-created').values_list('pk', 'created')
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, created=created)
+            for post_id, created in posts[:settings.FEED_BACKFILL]
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_id):
+    """Раскладывает новые посты автора по лентам всех его подписчиков."""
+    if is_celebrity(author_id):
+        return
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-created').values_list('pk', 'created')[:settings.FEED_BACKFILL])
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, created=created)
+            for user_id in followers.iterator()
+            for post_id, created in posts
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+    threshold = settings.FEED_CELEBRITY_FOLLOWERS
+    # Переход из pull в push видит ровно одна отписка: та, что сняла флаг
+    # или опустила неотмеченного автора под порог.
+    left = UserCounters.objects.filter(user_id=author_id).filter(
+        Q(feed_pulled=True, followers_count__lt=(
+            threshold - settings.FEED_CELEBRITY_HYSTERESIS))
+        | Q(feed_pulled=False, followers_count=threshold - 1)
+    ).update(feed_pulled=False)
+    if left:
+        # Посты автора больше не подмешиваются при чтении: раскладываем их
+        # по лентам после коммита, чтобы отписка не держала транзакцию.
+        transaction.on_commit(lambda: backfill_followers(author_id))
+
+
+def _reset_pulled(counters):
+    counters.exclude(pulled()).update(feed_pulled=False)
+    counters.filter(
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).update(feed_pulled=True)
+
+
+def rebuild():
+    """Заново раскладывает ленты по всем подпискам.
+
+    Нужна после массовой загрузки, которая обходит сигналы.
+    """
+    _reset_pulled(UserCounters.objects.all())
+    FeedEntry.objects.all().delete()
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        backfill(user_id, author_id)
+
+
+def add_loaded(author_ids, follows):
+    """Раскладывает по лентам загруженные в обход сигналов посты и подписки.
+
+    author_ids - авторы новых постов, follows - новые пары
+    (user_id, author_id). Остальные ленты не трогаются.
+    """
+    author_ids = set(author_ids)
+    touched = author_ids | {author_id for _, author_id in follows}
+    _reset_pulled(UserCounters.objects.filter(user_id__in=touched))
+    for author_id in author_ids:
+        backfill_followers(author_id)
+    for user_id, author_id in follows:
+        # Подписчикам авторов с новыми постами ленты уже дополнены.
+        if author_id not in author_ids:
+            backfill(user_id, author_id)
+
+
+def celebrities_followed_by(user):
+    """Авторы из подписок пользователя, чьи посты читаются при запросе."""
+    return list(Follow.objects.filter(
+        pulled('author__counters__'), user=user,
+    ).values_list('author_id', flat=True))
+
+
+class FeedPaginator(CursorPaginator):
+    """Курсорная лента подписок из разложенных и подмешанных постов."""
+
+    def __init__(self, user, per_page):
+        self.entries = FeedEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group').order_by('-created', '-post_id')
+        pulled = Post.objects.select_related('author', 'group').filter(
+            author_id__in=celebrities_followed_by(user))
+        super().__init__(pulled, per_page)
+
+    def fetch(self, key, older):
+        pushed = self.entries
+        if key is not None:
+            pushed = pushed.filter(
+                self._key_filter(key, older, ('created', 'post_id')))
+        if older:
+            pushed = list(pushed[:self.per_page + 1])
+        else:
+            pushed = list(pushed.order_by(
+                'created', 'post_id')[:self.per_page + 1])[::-1]
+        streams = merge(
+            super().fetch(key, older),
+            (entry.post for entry in pushed),
+            key=lambda post: (post.created, post.pk),
+            reverse=True,
+        )
+        posts = list(self._unique(streams))
+        if older:
+            return posts[:self.per_page + 1]
+        return posts[-self.per_page - 1:]
+
+    @staticmethod
+    def _unique(posts):
+        # Пост знаменитости мог попасть в ленты ещё до того,
+        # как у автора набралось много подписчиков.
+        seen = set()
+        for post in posts:
+            if post.pk not in seen:
+                seen.add(post.pk)
+                yield post
@@ -0,0 +1,24 @@
+from .forms import CommentForm
+from .models import Comment, Follow
+
+# Контекст дыр страниц из кэша (см. core.page_cache): то, что зависит
+# от посетителя, считается при каждом ответе.
+
+
+def follow_button(request, author_id, username):
+    user = request.user
+    return {
+        'is_owner': user.pk == author_id,
+        'following': user.is_authenticated and Follow.objects.filter(
+            author_id=author_id, user=user).exists(),
+    }
+
+
+def comment_form(request, post_id):
+    reply_to = request.GET.get('reply_to', '')
+    return {
+        'form': CommentForm(),
+        'reply_to': Comment.objects.select_related('author').filter(
+            pk=reply_to, post_id=post_id).first()
+        if request.user.is_authenticated and reply_to.isdigit() else None,
+    }
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from posts import benchmark
+
+# Настройки SQLite по умолчанию; выставляются явно, потому что режим
+# журнала сохраняется в файле базы.
+SQLITE_DEFAULT_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при одновременном чтении '
+        'ленты и записи комментариев с настройками по умолчанию и с '
+        'профилем SQLITE_PERFORMANCE_PRAGMAS. Отчёт выводится в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=1)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument(
+            '--output', help='Файл для отчёта вместо стандартного вывода.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда сравнивает только настройки SQLite')
+        # Нужна база в файле: у базы в памяти нет журнала и блокировок.
+        directory = tempfile.mkdtemp(prefix='bench_sqlite_')
+        connection.settings_dict['TEST'] = {
+            **connection.settings_dict.get('TEST', {}),
+            'NAME': os.path.join(directory, 'bench.sqlite3'),
+        }
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        report = {}
+        try:
+            report['volumes'] = benchmark.seed(
+                posts=options['posts'],
+                comments=options['posts'],
+                follows=0,
+            )
+            profiles = (
+                ('default', SQLITE_DEFAULT_PRAGMAS),
+                ('tuned', settings.SQLITE_PERFORMANCE_PRAGMAS),
+            )
+            for name, pragmas in profiles:
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    # Новые прагмы выставляются при следующем подключении.
+                    connection.close()
+                    report[name] = {
+                        'pragmas': pragmas,
+                        **benchmark.concurrent_load(
+                            duration=options['duration'],
+                            readers=options['readers'],
+                            writers=options['writers'],
+                        ),
+                    }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(directory, ignore_errors=True)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в JSON Lines '
+        'или CSV (CSV - по одной модели на файл).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию стандартный вывод.')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат; по умолчанию берётся из расширения файла.')
+        parser.add_argument(
+            '--model', action='append', choices=transfer.MODELS,
+            dest='models', help='Модель для выгрузки, можно несколько.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        models = [
+            model for model in transfer.MODELS
+            if model in (options['models'] or transfer.MODELS)
+        ]
+        if file_format == 'csv' and len(models) != 1:
+            raise CommandError('Для CSV укажите одну модель через --model')
+        stream = (
+            sys.stdout if path == '-'
+            else open(path, 'w', encoding='utf-8', newline='')
+        )
+        try:
+            if file_format == 'csv':
+                total = transfer.write_csv(
+                    stream, models[0], options['chunk_size'])
+            else:
+                total = transfer.write_jsonl(
+                    stream, models, options['chunk_size'])
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.stderr.write(f'Выгружено записей: {total}')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки из JSON Lines '
+        'или CSV пачками, затем пересчитывает счётчики, ленты и поиск.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат; по умолчанию берётся из расширения файла.')
+        parser.add_argument(
+            '--model', choices=transfer.MODELS,
+            help='Модель записей CSV-файла.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать неизвестных пользователей без пароля.')
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поиск после загрузки.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        if file_format == 'csv' and not options['model']:
+            raise CommandError('Для CSV укажите модель через --model')
+        importer = transfer.Importer(
+            batch_size=options['batch_size'],
+            create_users=options['create_users'],
+        )
+        with open(path, encoding='utf-8', newline='') as stream:
+            rows = (
+                transfer.read_csv(stream, options['model'])
+                if file_format == 'csv' else transfer.read_jsonl(stream)
+            )
+            try:
+                processed = importer.load(rows)
+            except (transfer.TransferError, IntegrityError) as error:
+                raise CommandError(error)
+            except KeyError as error:
+                raise CommandError(f'В записи нет поля {error}')
+        if not options['no_rebuild']:
+            importer.rebuild()
+        summary = ', '.join(
+            f'{model}: {count}' for model, count in processed.items())
+        self.stdout.write(self.style.SUCCESS(f'Обработано записей: {summary}'))
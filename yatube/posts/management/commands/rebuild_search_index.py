@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import backend
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс постов и комментариев.'
+
+    def handle(self, *args, **options):
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
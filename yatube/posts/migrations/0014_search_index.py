@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "body, post_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (rowid, post_id, body) "
+        "SELECT p.id * 2, p.id, p.text || ' ' || COALESCE(g.title, '') "
+        "|| ' ' || u.username || ' ' || u.first_name || ' ' || u.last_name "
+        "FROM posts_post p JOIN auth_user u ON u.id = p.author_id "
+        "LEFT JOIN posts_group g ON g.id = p.group_id"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (rowid, post_id, body) "
+        "SELECT c.id * 2 + 1, c.post_id, c.text || ' ' || u.username "
+        "|| ' ' || u.first_name || ' ' || u.last_name "
+        "FROM posts_comment c JOIN auth_user u ON u.id = c.author_id"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# Индекс для PostgresSearchBackend: документ в колонке tsvector с GIN.
+# На SQLite та же таблица - виртуальная FTS5 из миграции 0014.
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE TABLE posts_search ("
+        "id bigint PRIMARY KEY, post_id integer NOT NULL, "
+        "document tsvector NOT NULL)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX posts_search_document_idx "
+        "ON posts_search USING GIN (document)"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (id, post_id, document) "
+        "SELECT p.id * 2, p.id, to_tsvector('russian', concat_ws(' ', "
+        "p.text, g.title, u.username, u.first_name, u.last_name)) "
+        "FROM posts_post p JOIN auth_user u ON u.id = p.author_id "
+        "LEFT JOIN posts_group g ON g.id = p.group_id"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (id, post_id, document) "
+        "SELECT c.id * 2 + 1, c.post_id, to_tsvector('russian', concat_ws("
+        "' ', c.text, u.username, u.first_name, u.last_name)) "
+        "FROM posts_comment c JOIN auth_user u ON u.id = c.author_id"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_feed_pulled'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,12 +1,13 @@
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.dispatch import receiver
-from django.db import models
+from django.db import models, router, transaction
 from django.db.models.signals import pre_save
 
 
-from core.models import CreatedModel
+from core.models import AtomicSaveModel, CreatedModel
 
 User = get_user_model()
 
@@ -33,11 +34,33 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True,
     )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'пост'
         verbose_name_plural = 'посты'
+        # Индексы повторяют порядок лент (created, id), поэтому страница
+        # читается по индексу без сортировки.
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'],
+                name='post_created_idx',
+            ),
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='post_author_created_idx',
+            ),
+            models.Index(
+                fields=['group', '-created', '-id'],
+                name='post_group_created_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -56,6 +79,24 @@ class Group(models.Model):
         return self.title
 
 
+# Ответы хранятся материализованным путём: path - id предков от первого
+# ответа ветки до самого комментария, по PATH_WIDTH знаков base36 на
+# уровень. Сортировка по path даёт дерево в порядке обхода, а поддерево -
+# это диапазон path внутри ветки, поэтому оба читаются одним запросом по
+# индексу (root, path). У комментариев верхнего уровня path пустой.
+PATH_WIDTH = 8
+PATH_STEP = PATH_WIDTH + 1
+PATH_END = '~'
+
+
+def path_segment(pk):
+    digits = ''
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'[digit] + digits
+    return digits.rjust(PATH_WIDTH, '0') + '/'
+
+
 class Comment(CreatedModel):
     post = models.ForeignKey(
         Post,
@@ -75,14 +116,91 @@ class Comment(CreatedModel):
             'text': 'Текст комментария',
         }
     )
+    parent = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='replies',
+        verbose_name='Ответ на',
+    )
+    root = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='thread',
+        verbose_name='Ветка',
+        editable=False,
+    )
+    path = models.CharField(
+        'Путь в ветке', max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(
+        'Глубина', default=0, editable=False)
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'комментарий'
         verbose_name_plural = 'комментарии'
+        # Комментарии поста листаются курсором по (created, id).
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx',
+            ),
+            models.Index(
+                fields=['root', 'path'],
+                name='comment_thread_path_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        placing = self._state.adding and self.parent_id is not None
+        if not placing:
+            super().save(*args, **kwargs)
+            return
+        self._place(self.parent)
+        using = kwargs.get('using') or router.db_for_write(
+            Comment, instance=self)
+        # Ответ без своего сегмента в path выпал бы из дерева ветки:
+        # вставка и дописывание пути идут одной транзакцией.
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            # path включает собственный id, известный только после вставки.
+            self.path += path_segment(self.pk)
+            Comment.objects.using(using).filter(pk=self.pk).update(
+                path=self.path)
+
+    def _place(self, parent):
+        """Ветка и глубина ответа; слишком глубокий ответ поднимается выше.
 
+        Ответ на комментарий глубины COMMENT_MAX_DEPTH становится ответом
+        его предку, поэтому ветка не уходит глубже лимита.
+        """
+        depth = min(parent.depth + 1, settings.COMMENT_MAX_DEPTH)
+        self.root_id = parent.root_id or parent.pk
+        self.post_id = parent.post_id
+        self.depth = depth
+        self.path = parent.path[:(depth - 1) * PATH_STEP]
+        if depth <= parent.depth:
+            self.parent_id = (
+                int(self.path[-PATH_STEP:-1], 36) if self.path
+                else self.root_id
+            )
 
-class Follow(models.Model):
+    def subtree(self):
+        """Комментарий и все ответы под ним в порядке обхода дерева."""
+        if self.root_id is None:
+            return Comment.objects.filter(
+                models.Q(pk=self.pk) | models.Q(root=self)).order_by('path')
+        return Comment.objects.filter(
+            root_id=self.root_id,
+            path__gte=self.path,
+            path__lt=self.path + PATH_END,
+        ).order_by('path')
+
+
+class Follow(AtomicSaveModel):
     user = models.ForeignKey(
         User,
         related_name='follower',
@@ -106,6 +224,57 @@ class Follow(models.Model):
         )
 
 
+class UserCounters(models.Model):
+    """Счётчики пользователя, которые иначе пришлось бы считать COUNT(*)."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    feed_pulled = models.BooleanField(
+        'Посты подмешиваются в ленты при чтении', default=False)
+
+    class Meta:
+        verbose_name = 'счётчики пользователя'
+        verbose_name_plural = 'счётчики пользователей'
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок: пост автора в ленте подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='пост',
+    )
+    created = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'записи ленты'
+        unique_together = (
+            ('user', 'post'),
+        )
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-post'],
+                name='feed_user_created_idx',
+            ),
+        ]
+
+
 @receiver(pre_save, sender=Follow)
 def check_self_following(sender, instance, **kwargs):
     if instance.author == instance.user:
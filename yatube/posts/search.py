@@ -0,0 +1,251 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from .models import Comment, Post
+
+WORD = re.compile(r'\w+')
+
+
+def batches(queryset, ids=None):
+    """Делит выборку на пачки по возрастанию pk без OFFSET.
+
+    С ids пачки собираются только из записей с этими id.
+    """
+    size = settings.SEARCH_BATCH_SIZE
+    if ids is not None:
+        ids = sorted(ids)
+        for start in range(0, len(ids), size):
+            batch = list(queryset.filter(pk__in=ids[start:start + size]))
+            if batch:
+                yield batch
+        return
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+class BaseSearchBackend:
+    """Поисковый индекс по постам, комментариям, группам и авторам."""
+
+    def index_posts(self, posts):
+        raise NotImplementedError
+
+    def index_comments(self, comments):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def remove_comment(self, comment_id):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        """Возвращает id постов, от самых релевантных."""
+        raise NotImplementedError
+
+    def rebuild(self):
+        self.clear()
+        for posts in batches(Post.objects.select_related('author', 'group')):
+            self.index_posts(posts)
+        for comments in batches(Comment.objects.select_related('author')):
+            self.index_comments(comments)
+
+    def index(self, post_ids=(), comment_ids=()):
+        """Индексирует только указанные посты и комментарии."""
+        for posts in batches(Post.objects.select_related(
+                'author', 'group'), post_ids):
+            self.index_posts(posts)
+        for comments in batches(Comment.objects.select_related(
+                'author'), comment_ids):
+            self.index_comments(comments)
+
+    def clear(self):
+        pass
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Поиск LIKE-запросом для баз без полнотекстового индекса."""
+
+    def index_posts(self, posts):
+        pass
+
+    def index_comments(self, comments):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def search(self, query, limit):
+        condition = Q()
+        for word in WORD.findall(query):
+            condition &= (
+                Q(text__icontains=word)
+                | Q(group__title__icontains=word)
+                | Q(author__username__icontains=word)
+                | Q(comments__text__icontains=word)
+            )
+        if not condition:
+            return []
+        return list(Post.objects.filter(condition).values_list(
+            'pk', flat=True).distinct()[:limit])
+
+
+def post_document(post):
+    return ' '.join(filter(None, (
+        post.text,
+        post.group.title if post.group else '',
+        post.author.username,
+        post.author.get_full_name(),
+    )))
+
+
+def comment_document(comment):
+    return ' '.join(filter(None, (
+        comment.text,
+        comment.author.username,
+        comment.author.get_full_name(),
+    )))
+
+
+class TableSearchBackend(BaseSearchBackend):
+    """Индекс в отдельной таблице: документ на пост и на комментарий.
+
+    Ключ документа вычисляется из id: чётные у постов, нечётные
+    у комментариев, поэтому обновление и удаление идут по ключу.
+    """
+
+    table = 'posts_search'
+    key = 'id'
+
+    def index_posts(self, posts):
+        self._replace([
+            (post.pk * 2, post.pk, post_document(post)) for post in posts])
+
+    def index_comments(self, comments):
+        self._replace([
+            (comment.pk * 2 + 1, comment.post_id, comment_document(comment))
+            for comment in comments
+        ])
+
+    def remove_post(self, post_id):
+        self._delete([post_id * 2])
+
+    def remove_comment(self, comment_id):
+        self._delete([comment_id * 2 + 1])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def _delete(self, keys):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE {self.key} = %s',
+                [(key,) for key in keys],
+            )
+
+    def _replace(self, rows):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(TableSearchBackend):
+    """Инвертированный индекс SQLite FTS5 с ранжированием bm25."""
+
+    key = 'rowid'
+
+    def search(self, query, limit):
+        words = WORD.findall(query)
+        if not words:
+            return []
+        # Каждое слово берётся в кавычки, чтобы ввод пользователя
+        # не разбирался как синтаксис FTS5; звёздочка ищет по префиксу.
+        match = ' '.join(f'"{word}"*' for word in words)
+        ids = {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT post_id FROM {self.table} '
+                f'WHERE {self.table} MATCH %s ORDER BY rank',
+                [match],
+            )
+            # Пост и его комментарии — разные документы: оставляем
+            # лучшее совпадение для каждого поста.
+            for post_id, in cursor:
+                if post_id not in ids:
+                    ids[post_id] = None
+                    if len(ids) == limit:
+                        break
+        return list(ids)
+
+    def _replace(self, rows):
+        if not rows:
+            return
+        self._delete([rowid for rowid, _, _ in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, post_id, body) '
+                f'VALUES (%s, %s, %s)',
+                rows,
+            )
+
+
+class PostgresSearchBackend(TableSearchBackend):
+    """Колонка tsvector с GIN-индексом и ранжированием ts_rank.
+
+    Таблицу создаёт миграция 0019 только на PostgreSQL.
+    """
+
+    config = 'russian'
+
+    def search(self, query, limit):
+        words = WORD.findall(query)
+        if not words:
+            return []
+        # В слове \w+ нет операторов tsquery; :* ищет по префиксу.
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        with connection.cursor() as cursor:
+            # Пост и его комментарии — разные документы: пост ранжируется
+            # по лучшему из них.
+            cursor.execute(
+                f'SELECT post_id FROM {self.table}, '
+                f'to_tsquery(%s, %s) query WHERE document @@ query '
+                f'GROUP BY post_id '
+                f'ORDER BY max(ts_rank(document, query)) DESC, post_id DESC '
+                f'LIMIT %s',
+                [self.config, tsquery, limit],
+            )
+            return [post_id for post_id, in cursor]
+
+    def _replace(self, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (id, post_id, document) '
+                f'VALUES (%s, %s, to_tsvector(%s, %s)) '
+                f'ON CONFLICT (id) DO UPDATE SET '
+                f'post_id = EXCLUDED.post_id, document = EXCLUDED.document',
+                [(key, post_id, self.config, body)
+                 for key, post_id, body in rows],
+            )
+
+
+backend = SimpleLazyObject(
+    lambda: import_string(settings.SEARCH_BACKEND)())
+
+
+def load_posts(ids):
+    """Посты с указанными id в том же порядке."""
+    posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts]
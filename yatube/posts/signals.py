@@ -0,0 +1,198 @@
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from core.cache import bump_versions
+
+from . import counters, feed, thumbnails
+from .search import backend as search_backend, batches
+from .models import Comment, Follow, Group, Post, User, UserCounters
+
+
+# Счётчики обновляются раньше ленты: лента решает по числу подписчиков,
+# раскладывать ли посты автора.
+@receiver(post_save, sender=User)
+def create_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user(instance.author_id, followers_count=1)
+        counters.change_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, followers_count=-1)
+    counters.change_user(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_feeds(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed_on_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.mark_pulled(instance.author_id)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed_on_unfollow(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, raw=False, **kwargs):
+    instance._old_group_id = None
+    if instance.pk and not raw:
+        instance._old_group_id = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    scopes = [
+        ('index',), ('author', instance.author_id), ('post', instance.pk)]
+    for group_id in {instance.group_id, getattr(
+            instance, '_old_group_id', None)} - {None}:
+        scopes.append(('group', group_id))
+    bump_versions(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_page(sender, instance, **kwargs):
+    bump_versions(('post', instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_state(sender, instance, **kwargs):
+    # Подписка меняет счётчики обоих профилей и кнопку на профиле автора.
+    bump_versions(
+        ('follows', instance.user_id), ('follows', instance.author_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_fragments(sender, instance, **kwargs):
+    bump_versions(('index',), ('group', instance.pk))
+
+
+# Ленты показывают только имя автора: вход, смена пароля и прочие
+# сохранения пользователя фрагменты не трогают.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_name_change(sender, instance, update_fields=None, raw=False,
+                         **kwargs):
+    instance._name_changed = False
+    if raw or instance.pk is None or update_fields is not None and not (
+            set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_FIELDS).first()
+    instance._name_changed = old != tuple(
+        getattr(instance, field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_fragments(sender, instance, **kwargs):
+    if getattr(instance, '_name_changed', False):
+        bump_versions(('index',), ('author', instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search_backend.index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search_backend.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search_backend.index_comments([instance])
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search_backend.remove_comment(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def reindex_group_posts(sender, instance, raw=False, **kwargs):
+    if not raw:
+        for posts in batches(Post.objects.filter(
+                group=instance).select_related('author', 'group')):
+            search_backend.index_posts(posts)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    instance._post_ids = list(
+        instance.groups.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def reindex_former_group_posts(sender, instance, **kwargs):
+    for posts in batches(Post.objects.filter(
+            pk__in=getattr(instance, '_post_ids', [])).select_related(
+                'author', 'group')):
+        search_backend.index_posts(posts)
+
+
+@receiver(post_save, sender=User)
+def reindex_author(sender, instance, **kwargs):
+    # В индексе только имя автора (см. remember_name_change).
+    if not getattr(instance, '_name_changed', False):
+        return
+    for posts in batches(instance.posts.select_related('author', 'group')):
+        search_backend.index_posts(posts)
+    for comments in batches(instance.comments.select_related('author')):
+        search_backend.index_comments(comments)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image:
+        name = instance.image.name
+        scopes = thumbnails.post_scopes(instance)
+        transaction.on_commit(lambda: thumbnails.schedule(name, scopes))
@@ -0,0 +1,13 @@
+from django import template
+
+from posts.thumbnails import picture, post_scopes
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(image):
+    """Варианты картинки поста для <picture> или None, пока они готовятся."""
+    if not image:
+        return None
+    return picture(image.name, post_scopes(image.instance))
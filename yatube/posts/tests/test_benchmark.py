@@ -0,0 +1,33 @@
+from django.core.cache import cache
+from django.test import TestCase, tag
+
+from posts import benchmark
+from posts.models import FeedEntry, UserCounters
+
+
+@tag('benchmark')
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_rebuilds_derived_data(self):
+        """После заполнения пересчитаны счётчики и разложены ленты."""
+        volumes = benchmark.seed(
+            users=5, groups=2, posts=30, comments=20, follows=8)
+        self.assertEqual(volumes['posts'], 30)
+        self.assertEqual(volumes['follows'], 8)
+        self.assertEqual(UserCounters.objects.filter(
+            user__username__startswith='bench_').count(), 5)
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_report_covers_hot_pages(self):
+        """Отчёт содержит время и число запросов для каждой страницы."""
+        benchmark.seed(users=5, groups=2, posts=30, comments=20, follows=8)
+        report = benchmark.run(requests=3, warmup=1)
+        self.assertEqual(
+            set(report['endpoints']), set(benchmark.ENDPOINTS))
+        for name, result in report['endpoints'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(result['requests'], 3)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries_max'], 0)
@@ -1,18 +1,24 @@
 import shutil
 import tempfile
+from hashlib import md5
+from unittest import mock
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from core.cache import get_version
+from posts import thumbnails
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post, User
+from posts.thumbnails import ready_picture
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -75,6 +81,102 @@ class PostCreateFormTests(TestCase):
             ).exists()
         )
 
+    def test_create_post_makes_thumbnail(self):
+        """После публикации картинка показывается набором размеров."""
+        cache.clear()
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=self.SMALL_GIF,
+            content_type='image/gif'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+            follow=True
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        picture = ready_picture(post.image.name)
+        self.assertContains(response, picture['src'])
+        self.assertContains(response, picture['srcset'])
+        for source in picture['sources']:
+            with self.subTest(type=source['type']):
+                self.assertContains(response, source['srcset'])
+        self.assertNotContains(response, 'Изображение обрабатывается')
+
+    def test_thumbnail_placeholder_while_pending(self):
+        """Пока миниатюра готовится, вместо неё показывается заглушка."""
+        cache.clear()
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост в обработке',
+            image=SimpleUploadedFile(
+                name='pending.gif',
+                content=self.SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+        schedule_key = 'picture-pending:' + md5(
+            post.image.name.encode()).hexdigest()
+        cache.set(schedule_key, True)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, 'Изображение обрабатывается')
+
+    def image_post(self, name):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            group=self.group,
+            image=SimpleUploadedFile(
+                name=name, content=self.SMALL_GIF, content_type='image/gif'),
+        )
+
+    def test_feeds_show_picture_once_ready(self):
+        """Готовая картинка сбрасывает ленты, собранные с заглушкой."""
+        cache.clear()
+        post = self.image_post('feed.gif')
+        pending = 'picture-pending:' + md5(
+            post.image.name.encode()).hexdigest()
+        cache.set(pending, 'другой поток')
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+        )
+        for url in urls:
+            self.assertContains(
+                self.authorized_client.get(url), 'Изображение обрабатывается')
+        cache.delete(pending)
+        thumbnails.schedule(post.image.name, thumbnails.post_scopes(post))
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertNotContains(response, 'Изображение обрабатывается')
+                self.assertContains(
+                    response, ready_picture(post.image.name)['src'])
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_thumbnails_made_in_background_pool(self):
+        """Пул режет картинку в потоке и сдвигает версии ленты."""
+        cache.clear()
+        post = self.image_post('pool.gif')
+        version = get_version('index')
+        thumbnails.schedule(post.image.name, thumbnails.post_scopes(post))
+        # У пула один поток: пустая задача выполнится после нарезки.
+        thumbnails._get_executor().submit(lambda: None).result()
+        self.assertIsNotNone(ready_picture(post.image.name))
+        self.assertNotEqual(get_version('index'), version)
+
+    def test_ready_picture_survives_cache_flush(self):
+        """Готовность видна по файлам, и картинка не читается заново."""
+        post = self.image_post('flush.gif')
+        picture = thumbnails.generate(post.image.name)
+        cache.clear()
+        self.assertEqual(ready_picture(post.image.name), picture)
+        with mock.patch.object(thumbnails.Image, 'open') as image_open:
+            thumbnails.generate(post.image.name)
+        image_open.assert_not_called()
+
     def test_edit_post(self):
         """Валидная форма сохраняет измененную запись в базу."""
         posts_count = Post.objects.count()
@@ -96,7 +198,7 @@ class PostCreateFormTests(TestCase):
         )
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class CommentCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -150,6 +252,36 @@ class CommentCreateFormTests(TestCase):
         self.assertEqual(
             response.context['comments'][0].text, 'Тестовый текст #2')
 
+    def test_create_reply(self):
+        """Ответ на комментарий попадает в его ветку."""
+        parent = Comment.objects.create(
+            post=self.post, author=self.user, text='Ветка')
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Ответ', 'parent': parent.pk},
+            follow=True,
+        )
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual(reply.parent, parent)
+        self.assertEqual(reply.root, parent)
+        thread = next(
+            comment for comment in response.context['comments']
+            if comment.pk == parent.pk
+        )
+        self.assertEqual(thread.loaded_replies, [reply])
+
+    def test_reply_to_other_post_comment(self):
+        """Нельзя ответить на комментарий к другому посту."""
+        other = Post.objects.create(author=self.user, text='Другой пост')
+        parent = Comment.objects.create(
+            post=other, author=self.user, text='Чужая ветка')
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Ответ', 'parent': parent.pk},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.filter(text='Ответ').exists())
+
     def test_create_comment_guest(self):
         """Гость не может оставить комментарий."""
         comment_count = Comment.objects.count()
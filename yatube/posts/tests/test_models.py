@@ -1,6 +1,14 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-from posts.models import Comment, Follow, Group, Post, User
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.cache import get_version
+from posts.models import Comment, Follow, Group, Post, User, UserCounters
 
 FIELDS_VERBOSE_POST = {
     'text': 'Текст поста',
@@ -102,3 +110,132 @@ class PostModelTest(TestCase):
                     self.follow._meta.get_field(field).help_text,
                     expected_value
                 )
+
+
+class CountersModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_counters_follow_saves_and_deletes(self):
+        """Счётчики меняются при создании и удалении записей."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.counters(self.user).posts_count, 1)
+        self.assertEqual(self.counters(self.user).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        comment.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.counters(self.user).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_drifted_counters_do_not_block_deletes(self):
+        """Удаление при обнулённом счётчике не уводит его в минус."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.user)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=0)
+        UserCounters.objects.update(followers_count=0, following_count=0)
+        comment.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.counters(self.user).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_recount_counters_fixes_drift(self):
+        """Команда recount_counters исправляет разошедшиеся счётчики."""
+        UserCounters.objects.filter(user=self.user).update(posts_count=42)
+        UserCounters.objects.filter(user=self.reader).delete()
+        call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(self.counters(self.user).posts_count, 1)
+        self.assertEqual(self.counters(self.reader).posts_count, 0)
+
+
+class CommentThreadModelTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        cls.root = Comment.objects.create(
+            post=cls.post, author=cls.user, text='Ветка')
+
+    def reply(self, parent, text='Ответ'):
+        return Comment.objects.create(
+            post=self.post, author=self.user, parent=parent, text=text)
+
+    def test_reply_stores_path(self):
+        """Ответ знает ветку, глубину и путь от первого ответа."""
+        first = self.reply(self.root)
+        second = self.reply(first)
+        self.assertEqual(second.root, self.root)
+        self.assertEqual(second.depth, 2)
+        self.assertTrue(second.path.startswith(first.path))
+        second.refresh_from_db()
+        self.assertEqual(second.path.count('/'), 2)
+
+    def test_subtree_in_tree_order(self):
+        """Поддерево читается одним запросом в порядке обхода."""
+        first = self.reply(self.root)
+        second = self.reply(self.root)
+        nested = self.reply(first)
+        deepest = self.reply(nested)
+        with self.assertNumQueries(1):
+            thread = list(self.root.subtree())
+        self.assertEqual(
+            thread, [self.root, first, nested, deepest, second])
+        with self.assertNumQueries(1):
+            branch = list(first.subtree())
+        self.assertEqual(branch, [first, nested, deepest])
+
+    def test_reply_not_saved_without_path(self):
+        """Сбой при записи пути откатывает и вставку ответа."""
+        update = QuerySet.update
+
+        def fail_on_path(queryset, **kwargs):
+            if 'path' in kwargs:
+                raise DatabaseError('сбой записи пути')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', fail_on_path):
+            with self.assertRaises(DatabaseError):
+                self.reply(self.root, text='Потерянный ответ')
+        self.assertFalse(
+            Comment.objects.filter(text='Потерянный ответ').exists())
+
+    @override_settings(COMMENT_MAX_DEPTH=2)
+    def test_depth_limit(self):
+        """Ответ глубже лимита прикрепляется к предку на последнем уровне."""
+        first = self.reply(self.root)
+        second = self.reply(first)
+        third = self.reply(second)
+        self.assertEqual(third.depth, 2)
+        self.assertEqual(third.parent_id, first.pk)
+        self.assertEqual(list(first.subtree()), [first, second, third])
+
+
+class AuthorSaveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+
+    def test_login_keeps_feed_fragments(self):
+        """Сохранение без смены имени не сбрасывает фрагменты лент."""
+        version = get_version('index')
+        self.user.last_login = timezone.now()
+        self.user.save()
+        self.assertEqual(get_version('index'), version)
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertNotEqual(get_version('index'), version)
@@ -0,0 +1,134 @@
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+from posts.models import Comment, Follow, Group, Post, User
+
+# Для вошедшего пользователя два запроса уходят на сессию и пользователя.
+# Группа, профиль и пост ищутся по ключу ещё раз для проверки ETag.
+QUERY_BUDGETS = {
+    'posts:index': 3,
+    'posts:group_list': 5,
+    'posts:profile': 6,
+    'posts:post_detail': 6,
+    # Посты знаменитостей читаются отдельным запросом.
+    'posts:follow_index': 5,
+    'posts:search': 4,
+    'posts:post_create': 3,
+    'posts:post_edit': 4,
+    'posts:post_comments': 4,
+}
+
+# Страницы с курсором и имя страницы в их контексте.
+FEED_PAGES = {
+    'posts:index': 'page_obj',
+    'posts:group_list': 'page_obj',
+    'posts:profile': 'page_obj',
+    'posts:follow_index': 'page_obj',
+    'posts:post_comments': 'comments',
+}
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    query_budgets = QUERY_BUDGETS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.add_posts(cls.author, 60)
+        cls.post = Post.objects.filter(author=cls.author).first()
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.reader, text=f'Ответ {number}')
+            for number in range(60)
+        )
+
+    @classmethod
+    def add_posts(cls, author, count):
+        for number in range(count):
+            post = Post.objects.create(
+                author=author,
+                text=f'Тестовый пост {number}',
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f'Комментарий {number}')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.pages = {
+            'posts:index': (reverse('posts:index'), None),
+            'posts:group_list': (
+                reverse('posts:group_list', args=(self.group.slug,)), None),
+            'posts:profile': (
+                reverse('posts:profile', args=(self.author.username,)),
+                None),
+            'posts:post_detail': (
+                reverse('posts:post_detail', args=(self.post.pk,)), None),
+            'posts:follow_index': (reverse('posts:follow_index'), None),
+            'posts:post_comments': (
+                reverse('posts:post_comments', args=(self.post.pk,)), None),
+            'posts:search': (reverse('posts:search'), {'q': 'Тестовый'}),
+        }
+
+    def grow(self):
+        """Добавляет постов, комментариев и авторов в подписках."""
+        self.add_posts(self.author, 20)
+        other = User.objects.create_user(
+            username=f'other_{User.objects.count()}')
+        Follow.objects.create(user=self.reader, author=other)
+        self.add_posts(other, 20)
+
+    def test_pages_within_budget(self):
+        """Страницы укладываются в бюджет запросов."""
+        for name, (url, data) in self.pages.items():
+            with self.subTest(page=name):
+                self.assertQueryBudget(name, url, data)
+
+    def test_author_pages_within_budget(self):
+        """Формы поста укладываются в бюджет запросов."""
+        author_client = Client()
+        author_client.force_login(self.author)
+        pages = {
+            'posts:post_create': reverse('posts:post_create'),
+            'posts:post_edit': reverse(
+                'posts:post_edit', args=(self.post.pk,)),
+        }
+        for name, url in pages.items():
+            with self.subTest(page=name):
+                self.assertQueryBudget(name, url, client=author_client)
+
+    def test_query_count_does_not_grow(self):
+        """Число запросов не зависит от размера страницы и объёма данных."""
+        for name, (url, data) in self.pages.items():
+            with self.subTest(page=name):
+                self.assertConstantQueries(url, self.grow, data)
+
+    def test_pages_read_by_index(self):
+        """Страницы и их продолжения читаются по индексу без сортировки."""
+        for name, (url, data) in self.pages.items():
+            if name == 'posts:search':
+                continue
+            with self.subTest(page=name):
+                self.assertNoSort(url, data)
+        for name, context_name in FEED_PAGES.items():
+            url, _ = self.pages[name]
+            with self.subTest(page=name, cursor='after'):
+                page_obj = self.client.get(url).context[context_name]
+                self.assertTrue(page_obj.has_next())
+                self.assertNoSort(
+                    url, {'after': page_obj.paginator.next_cursor})
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=1)
+    def test_pulled_feed_within_budget(self):
+        """Лента с подмешанными постами знаменитостей в том же бюджете."""
+        url, data = self.pages['posts:follow_index']
+        self.assertQueryBudget('posts:follow_index', url, data)
+        self.assertConstantQueries(url, self.grow, data)
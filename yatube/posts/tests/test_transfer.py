@@ -0,0 +1,129 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts.models import (Comment, FeedEntry, Follow, Group, Post, User,
+                          UserCounters)
+from posts.search import backend
+
+
+class TransferCommandsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.author, text='Старый пост про котов', group=self.group)
+        self.created = timezone.now() - timedelta(days=30)
+        Post.objects.filter(pk=self.post.pk).update(created=self.created)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_jsonl_round_trip(self):
+        """Выгрузка и загрузка JSON Lines сохраняют записи, id и даты."""
+        call_command(
+            'export_posts', self.path('dump.jsonl'), stderr=StringIO())
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        Follow.objects.all().delete()
+        call_command(
+            'import_posts', self.path('dump.jsonl'), stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.created, self.created)
+        self.assertEqual(post.group.slug, self.group.slug)
+        self.assertEqual(post.comments.get().author, self.reader)
+        self.assertEqual(post.comments_count, 1)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).posts_count, 1)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertEqual(backend.search('котов', 10), [post.pk])
+
+    def test_rebuild_limited_to_loaded_records(self):
+        """После загрузки пересчитывается только загруженное."""
+        call_command(
+            'export_posts', self.path('dump.jsonl'), stderr=StringIO())
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        other = User.objects.create_user(username='other')
+        UserCounters.objects.filter(user=other).update(posts_count=5)
+        stale = Post.objects.create(author=other, text='Чужой пост')
+        FeedEntry.objects.create(
+            user=self.reader, post=stale, created=stale.created)
+        with mock.patch.object(backend, 'rebuild') as rebuild:
+            call_command(
+                'import_posts', self.path('dump.jsonl'), stdout=StringIO())
+        rebuild.assert_not_called()
+        self.assertEqual(
+            UserCounters.objects.get(user=other).posts_count, 6)
+        self.assertTrue(FeedEntry.objects.filter(post=stale).exists())
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.reader).following_count, 1)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.comments_count, 1)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertEqual(backend.search('котов', 10), [post.pk])
+
+    def test_import_can_be_repeated(self):
+        """Повторная загрузка не создаёт дубликатов."""
+        call_command(
+            'export_posts', self.path('dump.jsonl'), stderr=StringIO())
+        call_command(
+            'import_posts', self.path('dump.jsonl'), stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_conflicting_id_refused(self):
+        """Чужой пост с тем же id не получает комментарии из файла."""
+        call_command(
+            'export_posts', self.path('dump.jsonl'), stderr=StringIO())
+        Post.objects.all().delete()
+        other = Post.objects.create(
+            pk=self.post.pk, author=self.reader, text='Другой пост')
+        with self.assertRaisesMessage(CommandError, str(other.pk)):
+            call_command(
+                'import_posts', self.path('dump.jsonl'), stdout=StringIO())
+        self.assertFalse(other.comments.exists())
+        self.assertEqual(Post.objects.get().text, 'Другой пост')
+
+    def test_csv_posts_with_new_users(self):
+        """CSV загружается по одной модели, авторы создаются по флагу."""
+        call_command(
+            'export_posts', self.path('posts.csv'), model=['post'],
+            stderr=StringIO())
+        Post.objects.all().delete()
+        self.author.delete()
+        with self.assertRaisesMessage(CommandError, 'author'):
+            call_command(
+                'import_posts', self.path('posts.csv'), model='post',
+                stdout=StringIO())
+        call_command(
+            'import_posts', self.path('posts.csv'), model='post',
+            create_users=True, stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.author.username, 'author')
+        self.assertFalse(post.author.has_usable_password())
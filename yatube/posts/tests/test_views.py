@@ -1,14 +1,23 @@
+import json
 import shutil
 import tempfile
+import time
+from io import BytesIO
+from unittest import mock, skipUnless
+from zipfile import ZipFile
 
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
 
-from posts.models import Follow, Comment, Group, Post, User
+from core import page_cache
+from posts import feed
+from posts.models import FeedEntry, Follow, Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -22,6 +31,7 @@ TMP_NAME_GLOB = (
 )
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostsPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -75,6 +85,7 @@ class PostsPagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
         self.TMP_NAME = (
@@ -219,29 +230,103 @@ class PostsPagesTests(TestCase):
         self.assertEqual(
             response.context['page_obj'][0].text, post_new.text)
 
+    def test_follow_feed_is_materialized(self):
+        """Лента подписок заполняется при подписке и чистится при отписке."""
+        Follow.objects.create(user=self.new_user, author=self.user)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.new_user).count(), 2)
+        post_new = Post.objects.create(author=self.user, text='Новый пост')
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user=self.new_user, post=post_new).exists())
+        Follow.objects.filter(user=self.new_user, author=self.user).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.new_user).exists())
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=1)
+    def test_celebrity_posts_pulled_into_follow_feed(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.new_user})
+        )
+        post_new = Post.objects.create(
+            author=self.new_user, text='Пост популярного автора')
+        self.assertFalse(FeedEntry.objects.filter(post=post_new).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post_new])
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=3, FEED_CELEBRITY_HYSTERESIS=1)
+    def test_celebrity_returns_to_push_with_hysteresis(self):
+        """Автор у порога не раскладывается заново при каждой отписке,
+        а возвращение к раскладке идёт после коммита."""
+        author = User.objects.create_user(username='celebrity')
+        readers = [
+            User.objects.create_user(username=f'fan{number}')
+            for number in range(3)
+        ]
+        for reader in readers:
+            Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(author=author, text='Пост знаменитости')
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        with mock.patch.object(feed.transaction, 'on_commit') as on_commit:
+            Follow.objects.filter(user=readers[2]).delete()
+            on_commit.assert_not_called()
+            Follow.objects.filter(user=readers[1]).delete()
+        on_commit.assert_called_once()
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        on_commit.call_args[0][0]()
+        self.assertEqual(
+            list(FeedEntry.objects.filter(post=post).values_list(
+                'user', flat=True)),
+            [readers[0].pk],
+        )
+
     def test_index_page_cache_works(self):
         """В шаблон index настроено кэширование."""
         response = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(
-            response.context['page_obj'][1].author.username,
-            self.post.author.username
-        )
-        self.assertEqual(response.context['page_obj'][1].text, self.post.text)
-        self.assertTrue(Post.objects.filter(text='Тестовый пост').exists())
-        Post.objects.filter(text='Тестовый пост').delete()
-        self.assertFalse(Post.objects.filter(text='Тестовый пост').exists())
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response_new = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(
-            response.context['page_obj'][0].text,
-            response_new.context['page_obj'][0].text)
-        self.assertEqual(
-            response.content, response_new.content)
+        self.assertEqual(response.content, response_new.content)
         cache.clear()
         response_after_clear = self.authorized_client.get(
             reverse('posts:index'))
         self.assertNotEqual(
             response_after_clear.content, response_new.content)
 
+    def test_cache_invalidated_when_post_changes(self):
+        """Изменение поста сразу сбрасывает кэш затронутых лент."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Отредактированный пост'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Отредактированный пост')
+        post.group = self.group_another
+        post.save()
+        response = self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}))
+        self.assertNotContains(response, 'Отредактированный пост')
+
+    def test_post_fragment_refreshed_after_edit(self):
+        """Фрагмент поста в ленте подписок обновляется после правки."""
+        reader = Client()
+        reader.force_login(self.new_user)
+        Follow.objects.create(user=self.new_user, author=self.user)
+        reader.get(reverse('posts:follow_index'))
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Исправленный текст', 'group': self.group.id},
+        )
+        response = reader.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Исправленный текст')
+
 
 class PaginatorViewsTest(TestCase):
     @ classmethod
@@ -261,6 +346,7 @@ class PaginatorViewsTest(TestCase):
             )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -269,10 +355,17 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(
             len(response.context['page_obj']), settings.POST_COUNT)
 
+    def next_page(self, url):
+        # Первая страница нужна с контекстом, а не из кэша страниц.
+        cache.clear()
+        response = self.authorized_client.get(url)
+        cursor = response.context['page_obj'].paginator.next_cursor
+        return self.authorized_client.get(f'{url}?after={cursor}')
+
     def test_second_index_page_contains_three_records(self):
-        response = self.authorized_client.get(
-            reverse('posts:index') + '?page=2')
+        response = self.next_page(reverse('posts:index'))
         self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertFalse(response.context['page_obj'].has_next())
 
     def test_first_group_page_contains_ten_records(self):
         response = self.authorized_client.get(
@@ -282,9 +375,8 @@ class PaginatorViewsTest(TestCase):
             len(response.context['page_obj']), settings.POST_COUNT)
 
     def test_second_group_page_contains_three_records(self):
-        response = self.authorized_client.get(
-            reverse('posts:group_list', kwargs={
-                    'slug': self.post.group.slug}) + '?page=2'
+        response = self.next_page(
+            reverse('posts:group_list', kwargs={'slug': self.post.group.slug})
         )
         self.assertEqual(len(response.context['page_obj']), 3)
 
@@ -297,8 +389,474 @@ class PaginatorViewsTest(TestCase):
             len(response.context['page_obj']), settings.POST_COUNT)
 
     def test_second_profile_page_contains_three_records(self):
-        response = self.authorized_client.get(
+        response = self.next_page(
             reverse('posts:profile', kwargs={
-                    'username': self.post.author.username}) + '?page=2'
+                    'username': self.post.author.username})
         )
         self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_previous_page_returns_first_records(self):
+        """Курсор ?before= возвращает на предыдущую страницу."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        second = self.next_page(url).context['page_obj']
+        self.assertTrue(second.has_previous())
+        response = self.authorized_client.get(
+            f'{url}?before={second.paginator.previous_cursor}')
+        self.assertEqual(
+            list(response.context['page_obj']), list(first))
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?after=broken')
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POST_COUNT)
+
+
+@override_settings(COMMENT_COUNT=5)
+class CommentsViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='post_author')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(12)
+        )
+        cls.newest = list(Comment.objects.filter(post=cls.post))
+
+    def test_detail_embeds_first_chunk(self):
+        """На странице поста только первая порция, от новых к старым."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.newest[:5])
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'data-comments-more')
+
+    def test_fragment_returns_following_chunks(self):
+        """Фрагмент по курсору отдаёт следующие порции до конца."""
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        loaded = []
+        cursor = None
+        while True:
+            response = self.client.get(
+                url, {'after': cursor} if cursor else None)
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            comments = response.context['comments']
+            loaded.extend(comments)
+            if not comments.has_next():
+                break
+            cursor = comments.paginator.next_cursor
+        self.assertEqual(loaded, self.newest)
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_pages_split_by_thread(self):
+        """Ответы не занимают места на странице и идут за своей веткой."""
+        thread = self.newest[0]
+        replies = [
+            Comment.objects.create(
+                post=self.post, author=self.user, parent=thread,
+                text=f'Ответ {i}')
+            for i in range(6)
+        ]
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = list(response.context['comments'])
+        self.assertEqual(comments, self.newest[:5])
+        self.assertEqual(comments[0].loaded_replies, replies)
+
+    @override_settings(COMMENT_REPLIES=2)
+    def test_long_thread_capped(self):
+        """Длинная ветка показывает первые ответы, остальные - фрагментом."""
+        thread = self.newest[0]
+        replies = [
+            Comment.objects.create(
+                post=self.post, author=self.user, parent=thread,
+                text=f'Ответ {i}')
+            for i in range(5)
+        ]
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        first = response.context['comments'][0]
+        self.assertEqual(first.loaded_replies, replies[:2])
+        self.assertContains(response, 'Показать ещё ответы', count=1)
+        loaded = list(first.loaded_replies)
+        after = first.more_replies
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        while after:
+            response = self.client.get(
+                url, {'thread': thread.pk, 'replies_after': after})
+            self.assertTemplateUsed(response, 'posts/includes/replies.html')
+            loaded.extend(response.context['replies'])
+            after = response.context['more_replies']
+        self.assertEqual(loaded, replies)
+        self.assertNotContains(response, 'Показать ещё ответы')
+
+    def test_thread_fragment_of_other_post(self):
+        """Ветку чужого поста фрагмент не отдаёт."""
+        other = Post.objects.create(author=self.user, text='Другой пост')
+        root = Comment.objects.create(
+            post=other, author=self.user, text='Чужая ветка')
+        Comment.objects.create(
+            post=other, author=self.user, parent=root, text='Ответ')
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        for thread in (root.pk, 'broken'):
+            with self.subTest(thread=thread):
+                response = self.client.get(url, {'thread': thread})
+                self.assertEqual(response.status_code, 404)
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk + 100,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='post_author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовая группа',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=(self.group.slug,)),
+            'profile': reverse('posts:profile', args=(self.author.username,)),
+            'detail': reverse('posts:post_detail', args=(self.post.pk,)),
+        }
+
+    def revalidate(self, url, client=None):
+        """Повторный запрос с ETag первого ответа."""
+        client = client or self.client
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившаяся страница отвечает 304 без шаблона."""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_new_post_changes_feeds(self):
+        """Новый пост меняет ETag лент."""
+        for name in ('index', 'group', 'profile'):
+            with self.subTest(page=name):
+                etag = self.client.get(self.urls[name])['ETag']
+                Post.objects.create(
+                    author=self.author, text='Новый пост', group=self.group)
+                response = self.client.get(
+                    self.urls[name], HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_comment_changes_detail(self):
+        etag = self.client.get(self.urls['detail'])['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        response = self.client.get(
+            self.urls['detail'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_changes_profile(self):
+        client = Client()
+        client.force_login(self.reader)
+        etag = client.get(self.urls['profile'])['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = client.get(self.urls['profile'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отписаться')
+
+    def test_etag_depends_on_user(self):
+        """Страница другого пользователя не совпадает по ETag."""
+        etag = self.client.get(self.urls['index'])['ETag']
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(self.urls['index'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_new_login_gets_fresh_forms(self):
+        """После нового входа копия со старым CSRF-токеном не годится."""
+        client = Client()
+        client.force_login(self.reader)
+        client.get(self.urls['detail'])
+        etag = client.get(self.urls['detail'])['ETag']
+        client.logout()
+        client.force_login(self.reader)
+        response = client.get(self.urls['detail'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_replica_etag_expires(self):
+        """Страница из реплики не подтверждается ETag основной базы и
+        перепроверяется через REPLICA_FRAGMENT_CACHE_TTL."""
+        url = self.urls['index']
+        etag = self.client.get(url)['ETag']
+        with mock.patch('core.cache.reading_replica', return_value=True):
+            replica = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(replica.status_code, 200)
+            self.assertFalse(replica.has_header('Last-Modified'))
+            later = time.time() + settings.REPLICA_FRAGMENT_CACHE_TTL
+            with mock.patch('time.time', return_value=later):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=replica['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_guest_last_modified(self):
+        """Гость получает 304 и по If-Modified-Since."""
+        last_modified = self.client.get(self.urls['index'])['Last-Modified']
+        response = self.client.get(
+            self.urls['index'], HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_objects_still_404(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk + 100,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class PageCacheViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='post_author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_guest_page_served_without_queries(self):
+        """Повторный запрос гостя не трогает базу."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Тестовый пост')
+        self.assertNotContains(response, '<!--hole:')
+
+    def test_user_gets_own_header_from_shared_page(self):
+        """Страница, собранная для гостя, получает шапку пользователя."""
+        url = reverse('posts:profile', args=(self.author.username,))
+        self.client.get(url)
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertContains(response, 'Отписаться')
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Пользователь:')
+        self.assertContains(response, 'Подписаться')
+
+    def test_profile_shared_by_readers(self):
+        """Страницу профиля рисует один запрос для всех читателей."""
+        url = reverse('posts:profile', args=(self.author.username,))
+        other = Client()
+        other.force_login(User.objects.create_user(username='other'))
+        with mock.patch(
+                'core.page_cache._render_skeleton',
+                wraps=page_cache._render_skeleton) as render:
+            for client in (self.client, self.reader_client, other):
+                client.get(url)
+        render.assert_called_once()
+        self.assertContains(other.get(url), 'Подписаться')
+
+    def test_page_key_ignores_unknown_params(self):
+        """Посторонние параметры не плодят копий страницы в кэше."""
+        url = reverse('posts:index')
+        with mock.patch(
+                'core.page_cache._render_skeleton',
+                wraps=page_cache._render_skeleton) as render:
+            for params in ({}, {'utm_source': 'mail'}, {'x': 'y'}):
+                self.client.get(url, params)
+            render.assert_called_once()
+            self.client.get(url, {'page': '2'})
+        self.assertEqual(render.call_count, 2)
+
+    def test_comment_form_only_for_users(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.reader_client.get(url)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'name="text"')
+        self.assertContains(response, 'Войдите')
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'name="text"')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_new_post_replaces_cached_page(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        self.assertContains(self.client.get(url), 'Свежий пост')
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='writer', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Путешествия',
+            slug='travel',
+            description='Тестовая группа',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Поездка на Байкал', group=cls.group)
+        cls.other = Post.objects.create(
+            author=cls.user, text='Рецепт пирога')
+        Comment.objects.create(
+            post=cls.other, author=cls.user, text='Добавьте корицы')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_finds_posts_comments_groups_and_authors(self):
+        """Поиск идёт по тексту, комментариям, группам и авторам."""
+        cases = {
+            'байкал': [self.post],
+            'корицы': [self.other],
+            'путешеств': [self.post],
+            'толстой': [self.post, self.other],
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertCountEqual(self.search(query), expected)
+
+    def test_search_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении записей."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Поездка на Эльбрус'
+        post.save()
+        self.assertEqual(self.search('байкал'), [])
+        self.assertEqual(self.search('эльбрус'), [post])
+        Group.objects.filter(pk=self.group.pk).first().delete()
+        self.assertEqual(self.search('путешествия'), [])
+        post.delete()
+        self.assertEqual(self.search('эльбрус'), [])
+
+    def test_author_reindexed_only_on_rename(self):
+        """Вход не переписывает индекс, смена имени - переписывает."""
+        user = User.objects.get(pk=self.user.pk)
+        with mock.patch('posts.signals.search_backend') as backend:
+            user.last_login = timezone.now()
+            user.save()
+        backend.index_posts.assert_not_called()
+        user.last_name = 'Николаевич'
+        user.save()
+        self.assertCountEqual(
+            self.search('николаевич'), [self.post, self.other])
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_postgres_search_is_ranked(self):
+        """tsvector ранжирует пост с частым словом выше."""
+        self.assertEqual(
+            settings.SEARCH_BACKEND, 'posts.search.PostgresSearchBackend')
+        best = Post.objects.create(
+            author=self.user, text='Байкал, Байкал и снова Байкал')
+        self.assertEqual(self.search('байкал'), [best, self.post])
+
+    def test_search_query_syntax_is_escaped(self):
+        """Служебные символы запроса не ломают поиск."""
+        self.assertEqual(self.search('"байкал* ('), [self.post])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ExportViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+        cls.other = User.objects.create_user(username='other')
+        cls.SMALL_GIF = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Мой пост',
+            image=SimpleUploadedFile(
+                'export.gif', cls.SMALL_GIF, content_type='image/gif'),
+        )
+        Post.objects.create(author=cls.other, text='Чужой пост')
+        Comment.objects.create(
+            post=cls.post, author=cls.other, text='Чужой комментарий')
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='Мой комментарий')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_ndjson_contains_only_own_records(self):
+        """В выгрузку попадают только свои посты и комментарии."""
+        response = self.authorized_client.get(
+            reverse('posts:export'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [(row['model'], row['text']) for row in rows],
+            [('post', 'Мой пост'), ('comment', 'Мой комментарий')],
+        )
+
+    def test_zip_contains_data_and_images(self):
+        """Архив содержит записи и картинки постов."""
+        response = self.authorized_client.get(reverse('posts:export'))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            archive.namelist(), ['data.ndjson', self.post.image.name])
+        self.assertIn('Мой пост', archive.read('data.ndjson').decode())
+
+    @override_settings(POST_EXPORT_LIMIT=1)
+    def test_export_rate_limited(self):
+        """Слишком частые выгрузки получают 429."""
+        url = reverse('posts:export')
+        self.assertEqual(self.authorized_client.get(url).status_code, 200)
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_export_limit_key_expired(self):
+        """Ключ, истёкший между add и incr, открывает новый период."""
+        with mock.patch.object(cache, 'incr', side_effect=ValueError):
+            response = self.authorized_client.get(reverse('posts:export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get(f'export-limit:{self.user.pk}'), 1)
+
+    def test_export_without_cache(self):
+        """Недоступный кэш не мешает выгрузке и пишется в лог."""
+        with mock.patch.object(cache, 'add', side_effect=ConnectionError), \
+                self.assertLogs('posts.views', 'ERROR'):
+            response = self.authorized_client.get(reverse('posts:export'))
+        self.assertEqual(response.status_code, 200)
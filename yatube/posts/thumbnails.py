@@ -0,0 +1,214 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from core.cache import acquire_lock, bump_versions, release_lock
+from core.metrics import (THUMBNAIL_FAILURES, THUMBNAIL_IN_PROGRESS,
+                          THUMBNAIL_TIME)
+
+# Варианты картинок постов (несколько ширин и форматов) готовятся в фоновом
+# пуле потоков сразу после сохранения поста, а не при первом показе. Пока
+# их нет, шаблон показывает заглушку. Описание готовой <picture> лежит
+# в кэше, поэтому рендер стоит одного обращения к кэшу; если кэш его
+# потерял, готовность проверяется по файлам в хранилище. Работа с базой
+# в потоках не нужна: области фрагментов, которые нужно сбросить, когда
+# картинка готова, передаются вместе с ней.
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'AVIF': ('avif', 'image/avif'),
+    'WEBP': ('webp', 'image/webp'),
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+}
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _digest(source):
+    return md5(source.encode()).hexdigest()
+
+
+def supported_formats():
+    """Форматы из настроек, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [
+        image_format for image_format in settings.POST_IMAGE_FORMATS
+        if image_format in Image.SAVE
+        and (image_format != 'WEBP' or features.check('webp'))
+    ]
+
+
+def variant_name(source, width, image_format):
+    digest = _digest(source)
+    extension = FORMATS[image_format][0]
+    return (
+        f'{settings.THUMBNAIL_PREFIX}{digest[:2]}/{digest}_{width}w.'
+        f'{extension}'
+    )
+
+
+def post_scopes(post):
+    """Области фрагментов, в которых показывается картинка поста."""
+    scopes = [('index',), ('author', post.author_id), ('post', post.pk)]
+    if post.group_id is not None:
+        scopes.append(('group', post.group_id))
+    return scopes
+
+
+def _variants(source):
+    """Пары (ширина, формат) всех вариантов картинки."""
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    return [
+        (width, image_format)
+        for image_format in supported_formats() for width in widths
+    ]
+
+
+def _missing_variants(source):
+    return [
+        variant for variant in _variants(source)
+        if not default_storage.exists(variant_name(source, *variant))
+    ]
+
+
+def describe(source):
+    """Описание <picture> по именам вариантов, без чтения картинки."""
+    formats = supported_formats()
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    srcsets = {
+        image_format: ', '.join(
+            f'{default_storage.url(variant_name(source, width, image_format))}'
+            f' {width}w'
+            for width in widths
+        )
+        for image_format in formats
+    }
+    fallback = formats[-1]
+    return {
+        'sources': [
+            {'type': FORMATS[image_format][1], 'srcset': srcsets[image_format]}
+            for image_format in formats[:-1]
+        ],
+        'src': default_storage.url(
+            variant_name(source, widths[-1], fallback)),
+        'srcset': srcsets[fallback],
+        'sizes': settings.POST_IMAGE_SIZES,
+    }
+
+
+def ready_picture(source):
+    """Описание готовой <picture> или None, если варианты ещё не сделаны."""
+    key = f'picture:{_digest(source)}'
+    result = cache.get(key)
+    # Кэш мог потерять описание, а файлы остались: заново не режем. Для
+    # картинки в очереди all() остановится на первом же недостающем файле.
+    if result is None and all(
+            default_storage.exists(variant_name(source, *variant))
+            for variant in _variants(source)):
+        result = describe(source)
+        cache.set(key, result, timeout=None)
+    return result
+
+
+def _save_variant(image, source, width, image_format):
+    ratio_width, ratio_height = settings.POST_IMAGE_ASPECT
+    height = round(width * ratio_height / ratio_width)
+    variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    buffer = BytesIO()
+    variant.save(
+        buffer, format=image_format, quality=settings.POST_IMAGE_QUALITY)
+    default_storage.save(
+        variant_name(source, width, image_format),
+        ContentFile(buffer.getvalue()))
+
+
+def generate(source):
+    """Режет картинку по центру во все ширины и форматы из настроек.
+
+    Картинка читается, только если каких-то вариантов ещё нет.
+    """
+    missing = _missing_variants(source)
+    if missing:
+        with default_storage.open(source) as file:
+            image = Image.open(file)
+            image.load()
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for width, image_format in missing:
+            _save_variant(image, source, width, image_format)
+    picture = describe(source)
+    cache.set(f'picture:{_digest(source)}', picture, timeout=None)
+    return picture
+
+
+def _pending_key(source):
+    return f'picture-pending:{_digest(source)}'
+
+
+def _run(source, token, scopes):
+    start = time.perf_counter()
+    try:
+        generate(source)
+        THUMBNAIL_TIME.observe(time.perf_counter() - start)
+        # Ленты и страницы, собранные с заглушкой, должны получить картинку.
+        if scopes:
+            bump_versions(*scopes)
+    except Exception:
+        THUMBNAIL_FAILURES.inc()
+        logger.exception('Не удалось подготовить картинку %s', source)
+    finally:
+        THUMBNAIL_IN_PROGRESS.dec()
+        release_lock(_pending_key(source), token)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def schedule(source, scopes=()):
+    """Ставит картинку в очередь, если её варианты ещё не готовы.
+
+    Когда картинка будет готова, сдвигаются версии областей scopes.
+    """
+    if not source or ready_picture(source) is not None:
+        return
+    # Картинку режет один поток на все процессы, как в get_or_compute.
+    token = acquire_lock(
+        _pending_key(source), settings.THUMBNAIL_PENDING_TIMEOUT)
+    if token is None:
+        return
+    THUMBNAIL_IN_PROGRESS.inc()
+    if settings.THUMBNAIL_WORKERS:
+        _get_executor().submit(_run, source, token, scopes)
+    else:
+        _run(source, token, scopes)
+
+
+def picture(source, scopes=()):
+    """Описание <picture>; если его нет, ставит картинку в очередь."""
+    if not source:
+        return None
+    result = ready_picture(source)
+    if result is None:
+        schedule(source, scopes)
+        result = ready_picture(source)
+    return result
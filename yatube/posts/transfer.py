@@ -0,0 +1,332 @@
+import csv
+import json
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.text import capfirst
+
+from core.cache import bump_versions
+
+from . import feed
+from .counters import reconcile
+from .models import Comment, Follow, Group, Post, User
+from .search import backend
+
+# Выгрузка и загрузка контента потоком: записи читаются из базы порциями
+# через values(), без создания моделей, а загружаются пачками bulk_create.
+# Связи записываются по username и slug, у постов и комментариев
+# сохраняются id: на них ссылаются комментарии и их path. Сигналы при
+# bulk_create не срабатывают, поэтому после загрузки счётчики, ленты
+# и поисковый индекс пересчитываются для загруженных записей.
+
+# Порядок важен: запись может ссылаться только на записи выше по списку.
+MODELS = ('group', 'post', 'comment', 'follow')
+
+FIELDS = {
+    'group': ('slug', 'title', 'description'),
+    'post': ('id', 'author', 'group', 'text', 'created', 'updated', 'image'),
+    'comment': (
+        'id', 'post', 'author', 'text', 'created',
+        'parent', 'root', 'path', 'depth',
+    ),
+    'follow': ('user', 'author'),
+}
+
+_QUERIES = {
+    'group': (Group.objects, {}),
+    'post': (Post.objects, {
+        'author': 'author__username', 'group': 'group__slug'}),
+    'comment': (Comment.objects, {'author': 'author__username'}),
+    'follow': (Follow.objects, {
+        'user': 'user__username', 'author': 'author__username'}),
+}
+
+
+class TransferError(Exception):
+    """Ошибка в данных загружаемого файла."""
+
+
+def export_rows(model, chunk_size=1000, **filters):
+    """Записи модели в виде словарей с полями из FIELDS."""
+    manager, lookups = _QUERIES[model]
+    columns = [lookups.get(field, field) for field in FIELDS[model]]
+    if model == 'comment':
+        for field in ('post', 'parent', 'root'):
+            columns[FIELDS[model].index(field)] = f'{field}_id'
+    rows = manager.filter(**filters).order_by('pk').values_list(*columns)
+    for values in rows.iterator(chunk_size=chunk_size):
+        yield {
+            field: value.isoformat() if hasattr(value, 'isoformat') else value
+            for field, value in zip(FIELDS[model], values)
+        }
+
+
+def write_jsonl(stream, models=MODELS, chunk_size=1000):
+    """Пишет записи моделей в JSON Lines, по объекту на строку."""
+    total = 0
+    for model in models:
+        for row in export_rows(model, chunk_size):
+            stream.write(json.dumps(
+                {'model': model, **row}, ensure_ascii=False) + '\n')
+            total += 1
+    return total
+
+
+def write_csv(stream, model, chunk_size=1000):
+    """Пишет записи одной модели в CSV с заголовком."""
+    writer = csv.DictWriter(stream, fieldnames=FIELDS[model])
+    writer.writeheader()
+    total = 0
+    for row in export_rows(model, chunk_size):
+        writer.writerow(row)
+        total += 1
+    return total
+
+
+def read_jsonl(stream):
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            model = row.pop('model')
+        except (ValueError, KeyError, AttributeError):
+            raise TransferError(f'Строка {number}: ожидался объект с model')
+        yield model, row
+
+
+def read_csv(stream, model):
+    for row in csv.DictReader(stream):
+        yield model, row
+
+
+def auto_dates(model):
+    """Поля модели с auto_now или auto_now_add."""
+    return [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+
+
+class Importer:
+    """Загружает записи пачками с разрешением связей по username и slug.
+
+    Уже загруженные записи (тот же slug, пара подписки или тот же id
+    с тем же автором и датой) пропускаются, поэтому загрузку можно
+    повторить. Чужой пост или комментарий с тем же id - TransferError:
+    иначе комментарии из файла прицепились бы к нему.
+    """
+
+    def __init__(self, batch_size=1000, create_users=False):
+        self.batch_size = batch_size
+        self.create_users = create_users
+        self.buffers = {model: [] for model in MODELS}
+        self.users = {}
+        self.groups = {}
+        self.processed = dict.fromkeys(MODELS, 0)
+        # Что загружено впервые: по этим id пересчитываются счётчики,
+        # ленты и индекс, а повторно загруженное не трогается.
+        self.author_ids = set()
+        self.group_ids = set()
+        self.post_ids = set()
+        self.comment_ids = set()
+        self.commented_post_ids = set()
+        self.follows = set()
+
+    def add(self, model, row):
+        if model not in self.buffers:
+            raise TransferError(f'Неизвестная модель {model!r}')
+        buffer = self.buffers[model]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def load(self, rows):
+        for model, row in rows:
+            self.add(model, row)
+        self.flush()
+        self._reset_sequences()
+        return self.processed
+
+    def flush(self):
+        # Пачки сбрасываются вместе и по порядку MODELS: так комментарий
+        # найдёт пост, даже если тот ещё лежал в буфере.
+        with transaction.atomic():
+            for model in MODELS:
+                rows = self.buffers[model]
+                if rows:
+                    self.buffers[model] = []
+                    getattr(self, f'_load_{model}')(rows)
+
+    def rebuild(self):
+        """Пересчитывает для новых записей то, что обычно обновляют сигналы."""
+        followed = {pk for pair in self.follows for pk in pair}
+        reconcile(
+            user_ids=self.author_ids | followed,
+            post_ids=self.commented_post_ids,
+        )
+        feed.add_loaded(self.author_ids, self.follows)
+        backend.index(self.post_ids, self.comment_ids)
+        bump_versions(
+            ('index',),
+            *(('author', pk) for pk in self.author_ids),
+            *(('group', pk) for pk in self.group_ids),
+            *(('post', pk) for pk in self.commented_post_ids),
+            *(('follows', pk) for pk in followed),
+        )
+
+    @staticmethod
+    def _reset_sequences():
+        # id постов и комментариев заданы явно, и счётчик автоинкремента
+        # PostgreSQL нужно подвинуть за них.
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def _bulk_create(self, model, objects):
+        objects = list(objects)
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        self.processed[model._meta.model_name] += len(objects)
+        return objects
+
+    def _create_with_ids(self, model, objects, same):
+        """Создаёт записи с id из файла, пропуская уже загруженные.
+
+        same - поля, по которым запись с тем же id считается той же.
+        Возвращает созданные записи.
+        """
+        objects = list(objects)
+        existing = {
+            values[0]: values[1:]
+            for values in model.objects.filter(
+                pk__in=[obj.pk for obj in objects]).values_list('pk', *same)
+        }
+        new = []
+        for obj in objects:
+            if obj.pk not in existing:
+                new.append(obj)
+            elif existing[obj.pk] != tuple(
+                    getattr(obj, field) for field in same):
+                raise TransferError(
+                    f'{capfirst(model._meta.verbose_name)} с id {obj.pk} '
+                    f'уже есть в базе, и это другая запись')
+        # auto_now и auto_now_add ставят при вставке текущее время:
+        # даты из файла возвращаются отдельным запросом.
+        fields = auto_dates(model)
+        dates = [[getattr(obj, field) for field in fields] for obj in new]
+        model.objects.bulk_create(new, batch_size=self.batch_size)
+        for obj, values in zip(new, dates):
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+        model.objects.bulk_update(new, fields, batch_size=self.batch_size)
+        self.processed[model._meta.model_name] += len(objects)
+        return new
+
+    def _load_group(self, rows):
+        self._bulk_create(Group, (
+            Group(
+                slug=row['slug'],
+                title=row['title'],
+                description=row.get('description') or '',
+            )
+            for row in rows
+        ))
+
+    def _load_post(self, rows):
+        users = self._resolve_users(row['author'] for row in rows)
+        groups = self._resolve_groups(
+            row['group'] for row in rows if row.get('group'))
+        new = self._create_with_ids(Post, (
+            Post(
+                pk=int(row['id']),
+                author_id=users[row['author']],
+                group_id=groups[row['group']] if row.get('group') else None,
+                text=row['text'],
+                created=self._datetime(row['created']),
+                updated=self._datetime(row.get('updated') or row['created']),
+                image=row.get('image') or '',
+            )
+            for row in rows
+        ), same=('author_id', 'created'))
+        self.post_ids.update(post.pk for post in new)
+        self.author_ids.update(post.author_id for post in new)
+        self.group_ids.update(post.group_id for post in new if post.group_id)
+
+    def _load_comment(self, rows):
+        users = self._resolve_users(row['author'] for row in rows)
+        new = self._create_with_ids(Comment, (
+            Comment(
+                pk=int(row['id']),
+                post_id=int(row['post']),
+                author_id=users[row['author']],
+                text=row['text'],
+                created=self._datetime(row['created']),
+                parent_id=self._id(row.get('parent')),
+                root_id=self._id(row.get('root')),
+                path=row.get('path') or '',
+                depth=int(row.get('depth') or 0),
+            )
+            for row in rows
+        ), same=('post_id', 'author_id', 'created'))
+        self.comment_ids.update(comment.pk for comment in new)
+        self.commented_post_ids.update(comment.post_id for comment in new)
+
+    def _load_follow(self, rows):
+        users = self._resolve_users(
+            name for row in rows for name in (row['user'], row['author']))
+        # Какие пары уже были, bulk_create с ignore_conflicts не сообщает:
+        # раскладка лент по ним повторяется без вреда.
+        follows = self._bulk_create(Follow, (
+            Follow(user_id=users[row['user']], author_id=users[row['author']])
+            for row in rows
+            if row['user'] != row['author']
+        ))
+        self.follows.update(
+            (follow.user_id, follow.author_id) for follow in follows)
+
+    def _resolve_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        if missing:
+            found = dict(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+            unknown = missing - set(found)
+            if unknown and not self.create_users:
+                raise TransferError(
+                    f'Нет пользователей: {", ".join(sorted(unknown))}')
+            if unknown:
+                new_users = [User(username=name) for name in unknown]
+                for user in new_users:
+                    user.set_unusable_password()
+                User.objects.bulk_create(new_users)
+                found.update(User.objects.filter(
+                    username__in=unknown).values_list('username', 'pk'))
+            self.users.update(found)
+        return self.users
+
+    def _resolve_groups(self, slugs):
+        missing = set(slugs) - set(self.groups)
+        if missing:
+            found = dict(Group.objects.filter(
+                slug__in=missing).values_list('slug', 'pk'))
+            unknown = missing - set(found)
+            if unknown:
+                raise TransferError(
+                    f'Нет групп: {", ".join(sorted(unknown))}')
+            self.groups.update(found)
+        return self.groups
+
+    @staticmethod
+    def _id(value):
+        return int(value) if value not in (None, '') else None
+
+    @staticmethod
+    def _datetime(value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise TransferError(f'Неверная дата {value!r}')
+        return parsed
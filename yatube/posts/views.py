@@ -1,10 +1,25 @@
+import logging
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core.cache import conditional_page, fragment_context
+from core.page_cache import cached_page
+from core.routers import use_replica
+from core.paginator import paginate
+
+from . import archive
+from .comments import ThreadPaginator, reply_page
+from .feed import FeedPaginator
 from .forms import PostForm, CommentForm
 from .models import Follow, Comment, Group, Post, User
+from .search import backend as search_backend, load_posts
+
+logger = logging.getLogger(__name__)
 
 
 def authorized_only(func):
@@ -17,65 +32,166 @@ def authorized_only(func):
     return check_user
 
 
+def index_scopes(request):
+    return [('index',)]
+
+
+def group_scopes(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    return None if group_id is None else [('group', group_id)]
+
+
+def profile_scopes(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return [('author', author_id), ('follows', author_id)]
+
+
+def reader_scopes(request):
+    # Кнопка подписки зависит от подписок читателя, но она дыра: общая
+    # страница в кэше от них не зависит, меняется только ETag.
+    if request.user.is_authenticated:
+        return [('follows', request.user.pk)]
+    return []
+
+
+def post_scopes(request, post_id):
+    found = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id').first()
+    if found is None:
+        return None
+    author_id, group_id = found
+    scopes = [('post', post_id), ('author', author_id)]
+    if group_id is not None:
+        scopes.append(('group', group_id))
+    return scopes
+
+
+@use_replica
+@conditional_page(index_scopes)
+@cached_page(index_scopes)
 def index(request):
     post_list = Post.objects.select_related('group', 'author').all()
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list)
     context = {
         'page_obj': page_obj,
         'index': True,
+        **fragment_context('index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@use_replica
+@conditional_page(group_scopes)
+@cached_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_list = group.groups.select_related('group', 'author').all()
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list)
     context = {
         'group': group,
         'page_obj': page_obj,
+        **fragment_context('group', group.pk),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@use_replica
+@conditional_page(profile_scopes, reader_scopes)
+@cached_page(profile_scopes)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(
+        User.objects.select_related('counters'), username=username)
     user_post_list = Post.objects.select_related(
         'group', 'author').filter(author=user)
-    paginator = Paginator(user_post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(author=user, user=request.user).exists()
-    )
+    page_obj = paginate(request, user_post_list)
     context = {
         'page_obj': page_obj,
         'author': user,
-        'following': following,
+        **fragment_context('author', user.pk),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@use_replica
+def search(request):
+    query = request.GET.get('q', '').strip()
+    ids = search_backend.search(
+        query, settings.SEARCH_MAX_RESULTS) if query else []
+    page_obj = Paginator(ids, settings.POST_COUNT).get_page(
+        request.GET.get('page'))
+    page_obj.object_list = load_posts(page_obj.object_list)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@use_replica
+@conditional_page(post_scopes)
+@cached_page(post_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.select_related('author').filter(post=post)
-    post_number = Post.objects.filter(author=post.author).count()
-    form = CommentForm()
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'), pk=post_id)
     context = {
-        'post_number': post_number,
         'post': post,
-        'comments': comments,
-        # в процессе.
-        'form': form,
+        'comments': comment_page(request, post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_page(request, post_id):
+    """Порция веток комментариев поста по курсору из запроса."""
+    paginator = ThreadPaginator(
+        post_id, settings.COMMENT_COUNT, settings.COMMENT_REPLIES)
+    return paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+@use_replica
+def post_comments(request, post_id):
+    """Следующая порция комментариев фрагментом для «Показать ещё».
+
+    С параметром thread - следующие ответы этой ветки после replies_after.
+    """
+    if 'thread' in request.GET:
+        return thread_replies(request, post_id)
+    comments = comment_page(request, post_id)
+    if not comments and not Post.objects.filter(pk=post_id).exists():
+        raise Http404('Пост не найден')
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def thread_replies(request, post_id):
+    try:
+        root_id = int(request.GET['thread'])
+    except ValueError:
+        raise Http404('Ветка не найдена')
+    replies, more = reply_page(
+        post_id, root_id, request.GET.get('replies_after', ''),
+        settings.COMMENT_REPLIES)
+    if not replies and not Comment.objects.filter(
+            pk=root_id, post_id=post_id, parent__isnull=True).exists():
+        raise Http404('Ветка не найдена')
+    context = {
+        'post_id': post_id,
+        'root_id': root_id,
+        'replies': replies,
+        'more_replies': more,
+    }
+    return render(request, 'posts/includes/replies.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -93,7 +209,7 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
+    if post.author_id != request.user.pk:
         return redirect('posts:post_detail', post_id=post_id)
 
     form = PostForm(
@@ -115,22 +231,30 @@ def post_edit(request, post_id):
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
+    parent_id = request.POST.get('parent', '')
+    parent = None
+    if parent_id:
+        if not parent_id.isdigit():
+            raise Http404('Комментарий не найден')
+        parent = get_object_or_404(Comment, pk=parent_id, post=post)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        comment.parent = parent
         comment.save()
         return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@use_replica
 def follow_index(request):
-    post_list_follow = Post.objects.filter(
-        author__in=Follow.objects.filter(user=request.user).values('author'))
-    paginator = Paginator(post_list_follow, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = FeedPaginator(request.user, settings.POST_COUNT)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     context = {
         'page_obj': page_obj,
         'follow': True,
@@ -154,3 +278,42 @@ def profile_unfollow(request, username):
     if request.user != author and unfollow.exists():
         Follow.objects.filter(author=author, user=request.user).delete()
     return redirect('posts:profile', username=author)
+
+
+def count_export(user):
+    """Номер выгрузки пользователя за период; None, если кэш недоступен."""
+    key = f'export-limit:{user.pk}'
+    try:
+        cache.add(key, 0, settings.POST_EXPORT_PERIOD)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Ключ истёк между add и incr: начинается новый период.
+            cache.set(key, 1, settings.POST_EXPORT_PERIOD)
+            return 1
+    except Exception:
+        logger.exception('Лимит выгрузок не проверен: кэш недоступен')
+        return None
+
+
+@login_required
+def export(request):
+    file_format = 'ndjson' if request.GET.get('format') == 'ndjson' else 'zip'
+    # Без кэша выгрузка не запрещается: лимит лишь бережёт сервер.
+    count = count_export(request.user)
+    if count is not None and count > settings.POST_EXPORT_LIMIT:
+        response = HttpResponse(
+            'Слишком много выгрузок, попробуйте позже.', status=429)
+        response['Retry-After'] = settings.POST_EXPORT_PERIOD
+        return response
+    if file_format == 'ndjson':
+        response = StreamingHttpResponse(
+            archive.stream_ndjson(request.user),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+    else:
+        response = StreamingHttpResponse(
+            archive.stream_zip(request.user), content_type='application/zip')
+    filename = f'{request.user.username}-posts.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -28,6 +28,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestStatsMiddleware',
+    'core.middleware.DatabaseBusyMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,7 +46,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -53,6 +56,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.cache.cache_ttl',
             ],
         },
     },
@@ -60,13 +64,99 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# База задаётся переменными окружения. Без DB_ENGINE используется SQLite,
+# на ней же идут тесты. DB_ENGINE=postgresql включает PostgreSQL
+# с постоянными соединениями (DB_CONN_MAX_AGE секунд), а
+# DB_ENGINE=postgresql_pool - с пулом соединений в каждом процессе.
+DB_ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+    'postgresql_pool': 'core.db_backends.postgresql_pool',
+}
+
+
+def database_from_env(prefix='DB_'):
+    engine = os.environ.get(f'{prefix}ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        return {
+            'ENGINE': DB_ENGINES[engine],
+            'NAME': os.environ.get(
+                f'{prefix}NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    database = {
+        'ENGINE': DB_ENGINES[engine],
+        'NAME': os.environ.get(f'{prefix}NAME', 'yatube'),
+        'USER': os.environ.get(f'{prefix}USER', 'yatube'),
+        'PASSWORD': os.environ.get(f'{prefix}PASSWORD', ''),
+        'HOST': os.environ.get(f'{prefix}HOST', 'localhost'),
+        'PORT': os.environ.get(f'{prefix}PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get(f'{prefix}CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            'connect_timeout': int(
+                os.environ.get(f'{prefix}CONNECT_TIMEOUT', 5)),
+        },
+    }
+    if engine == 'postgresql_pool':
+        # Соединение возвращается в пул в конце каждого запроса.
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS'].update(
+            POOL_MIN_SIZE=int(os.environ.get(f'{prefix}POOL_MIN_SIZE', 1)),
+            POOL_MAX_SIZE=int(os.environ.get(f'{prefix}POOL_MAX_SIZE', 10)),
+            POOL_TIMEOUT=float(os.environ.get(f'{prefix}POOL_TIMEOUT', 2)),
+        )
+    return database
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    'default': database_from_env(),
+}
+
+# Реплики для чтения: DB_REPLICAS=replica1,replica2, параметры каждой -
+# в переменных DB_REPLICA1_NAME, DB_REPLICA1_HOST и так далее. В тестах
+# реплика смотрит в ту же базу, что и default.
+REPLICA_DATABASES = [
+    alias.strip() for alias in os.environ.get('DB_REPLICAS', '').split(',')
+    if alias.strip()
+]
+
+DATABASES.update({
+    alias: {
+        **database_from_env(f'DB_{alias.upper()}_'),
+        'TEST': {'MIRROR': 'default'},
     }
+    for alias in REPLICA_DATABASES
+})
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает из основной базы.
+REPLICA_STICKY_SECONDS = 10
+
+REPLICA_STICKY_COOKIE = 'read_primary'
+
+# Время жизни фрагментов шаблонов, собранных из данных реплики.
+REPLICA_FRAGMENT_CACHE_TTL = 30
+
+# Профиль SQLite для установки на одном сервере: журнал WAL не блокирует
+# чтение во время записи, synchronous=NORMAL в WAL безопасен при падении
+# процесса, mmap и увеличенный кэш страниц ускоряют чтение, а busy_timeout
+# заставляет писателей ждать друг друга вместо ошибки «database is locked».
+SQLITE_PERFORMANCE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
 }
 
+# Прагмы для каждого нового соединения SQLite; профиль включается
+# переменной окружения DB_SQLITE_TUNING=1.
+SQLITE_PRAGMAS = (
+    SQLITE_PERFORMANCE_PRAGMAS
+    if os.environ.get('DB_SQLITE_TUNING') == '1' else {}
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -112,10 +202,201 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Кэш задаётся переменными окружения. Без CACHE_BACKEND у каждого процесса
+# свой LocMemCache; CACHE_BACKEND=redis или memcached включает общий кэш
+# по адресу CACHE_LOCATION. С CACHE_L1_TIMEOUT перед общим кэшем ставится
+# память процесса на столько секунд. Попадания и промахи считаются
+# обёрткой MetricsCache.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'redis': 'django_redis.cache.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+}
+
+CACHE_LOCATIONS = {
+    'locmem': '',
+    'redis': 'redis://localhost:6379/1',
+    'memcached': 'localhost:11211',
+}
+
+
+def cache_from_env(prefix='CACHE_'):
+    backend = os.environ.get(f'{prefix}BACKEND', 'locmem')
+    shared = {
+        'BACKEND': CACHE_BACKENDS[backend],
+        'OPTIONS': {},
     }
+    if backend == 'redis':
+        # Недоступный Redis - это промах, а не ошибка страницы.
+        shared['OPTIONS']['IGNORE_EXCEPTIONS'] = True
+    l1_timeout = int(os.environ.get(f'{prefix}L1_TIMEOUT', 0))
+    if l1_timeout:
+        shared = {
+            'BACKEND': 'core.cache_backends.TieredCache',
+            'OPTIONS': {
+                **shared,
+                'L1_TIMEOUT': l1_timeout,
+                'L1_MAX_ENTRIES': int(
+                    os.environ.get(f'{prefix}L1_MAX_ENTRIES', 1000)),
+            },
+        }
+    return {
+        'BACKEND': 'core.cache_backends.MetricsCache',
+        'LOCATION': os.environ.get(
+            f'{prefix}LOCATION', CACHE_LOCATIONS[backend]),
+        'KEY_PREFIX': os.environ.get(f'{prefix}KEY_PREFIX', 'yatube'),
+        'VERSION': int(os.environ.get(f'{prefix}VERSION', 1)),
+        'OPTIONS': shared,
+    }
+
+
+CACHES = {
+    'default': cache_from_env(),
 }
 
 POST_COUNT = 10
+
+# Комментарии под постом подгружаются порциями по столько штук.
+COMMENT_COUNT = 20
+
+# Сколько ответов ветки показывается сразу; остальные подгружаются
+# кнопкой «Показать ещё ответы».
+COMMENT_REPLIES = 20
+
+# Ответы глубже этого уровня прикрепляются к предку на этом уровне.
+COMMENT_MAX_DEPTH = 5
+
+# Сколько последних постов автора попадает в ленту при подписке.
+FEED_BACKFILL = 500
+
+FEED_BATCH_SIZE = 500
+
+# С этого числа подписчиков посты автора не раскладываются по лентам,
+# а подмешиваются в ленту при чтении.
+FEED_CELEBRITY_FOLLOWERS = 1000
+
+# Раскладка по лентам возвращается, когда подписчиков стало меньше
+# FEED_CELEBRITY_FOLLOWERS - FEED_CELEBRITY_HYSTERESIS.
+FEED_CELEBRITY_HYSTERESIS = 100
+
+# Входит в ETag страниц: новый релиз с другими шаблонами сбрасывает
+# закэшированные браузерами страницы.
+PAGE_ETAG_SALT = os.environ.get('RELEASE', '')
+
+# Страницы целиком (core.page_cache) сбрасываются теми же версиями, но
+# содержат и то, что версиями не отслеживается, например год в подвале.
+PAGE_CACHE_TTL = 60 * 10
+
+# Дыры страниц из кэша: шаблон и функция, готовящая его контекст.
+PAGE_CACHE_HOLES = {
+    'header': ('includes/header.html', None),
+    'switcher': ('posts/includes/switcher.html', None),
+    'follow_button': (
+        'posts/includes/follow_button.html', 'posts.holes.follow_button'),
+    'post_edit_button': ('posts/includes/post_edit_button.html', None),
+    'comment_form': (
+        'posts/includes/comment_form.html', 'posts.holes.comment_form'),
+}
+
+# Фрагменты лент сбрасываются сигналами, поэтому живут долго.
+FRAGMENT_CACHE_TTL = 60 * 60 * 24
+
+# Сколько секунд после устаревания фрагмент ещё отдаётся, пока один
+# запрос считает новый (core.cache.get_or_compute).
+FRAGMENT_STALE_TTL = 60
+
+# Пересчёт ключа одним запросом: блокировка живёт не дольше
+# SINGLE_FLIGHT_LOCK_TIMEOUT, остальные ждут до SINGLE_FLIGHT_WAIT секунд,
+# проверяя кэш каждые SINGLE_FLIGHT_POLL секунд.
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT = 3
+SINGLE_FLIGHT_POLL = 0.05
+
+
+SEARCH_BACKENDS = {
+    DB_ENGINES['sqlite']: 'posts.search.SQLiteFTSBackend',
+    DB_ENGINES['postgresql']: 'posts.search.PostgresSearchBackend',
+    DB_ENGINES['postgresql_pool']: 'posts.search.PostgresSearchBackend',
+}
+
+
+def search_backend_from_env(database):
+    """Поисковый индекс под движок базы: FTS5 на SQLite, tsvector на
+    PostgreSQL, на остальных базах - запрос LIKE.
+
+    Таблицы индексов создают миграции 0014 и 0019, каждая на своей базе.
+    SEARCH_BACKEND в окружении задаёт бэкенд явно.
+    """
+    default = SEARCH_BACKENDS.get(
+        database['ENGINE'], 'posts.search.DatabaseSearchBackend')
+    return os.environ.get('SEARCH_BACKEND', default)
+
+
+SEARCH_BACKEND = search_backend_from_env(DATABASES['default'])
+
+SEARCH_MAX_RESULTS = 500
+
+SEARCH_BATCH_SIZE = 500
+
+# Картинки постов режутся по центру до пропорций POST_IMAGE_ASPECT в каждой
+# ширине и каждом формате; последний формат — запасной для <img>.
+# Форматы, которые не умеет сохранять Pillow, пропускаются.
+POST_IMAGE_ASPECT = (960, 339)
+
+POST_IMAGE_WIDTHS = (320, 640, 960)
+
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+
+POST_IMAGE_QUALITY = 80
+
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+THUMBNAIL_PREFIX = 'cache/thumbnails/'
+
+# 0 — готовить картинки сразу, без фонового пула.
+THUMBNAIL_WORKERS = 2
+
+THUMBNAIL_PENDING_TIMEOUT = 60
+
+# Сколько архивов своих постов пользователь может скачать за период.
+POST_EXPORT_LIMIT = 3
+
+POST_EXPORT_PERIOD = 60 * 60
+
+# Порог, после которого запрос пишется в лог с самыми долгими SQL.
+REQUEST_STATS_SLOW_MS = 300
+
+REQUEST_STATS_MAX_QUERIES = 30
+
+REQUEST_STATS_SLOWEST_QUERIES = 5
+
+# Доступ к /metrics/ без входа: токен из заголовка
+# Authorization: Bearer <METRICS_TOKEN> или адрес из METRICS_ALLOWED_IPS
+# (через запятую). По умолчанию оба пусты и метрики видят только
+# сотрудники: за локальным прокси все запросы приходят с 127.0.0.1.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',')
+    if ip.strip()
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'posts': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -0,0 +1,26 @@
+import atexit
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# Настройки для pytest и manage.py test --settings=yatube.test_settings.
+# Загрузки и варианты картинок пишутся во временный
+# каталог, а не в media проекта. Картинки режутся сразу: потоки фонового
+# пула пережили бы тест.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='yatube-media-')
+atexit.register(shutil.rmtree, MEDIA_ROOT, True)
+
+THUMBNAIL_WORKERS = 0
+
+# Настоящее соединение с репликой-зеркалом default: тесты роутера смотрят,
+# в какое соединение ушли запросы. Включают реплику сами тесты через
+# REPLICA_DATABASES, остальные читают из default как обычно.
+# Словарь копируется: поиск тестов импортирует и этот модуль.
+DATABASES = {
+    **DATABASES,  # noqa: F405
+    'replica': {
+        **DATABASES['default'],  # noqa: F405
+        'TEST': {'MIRROR': 'default'},
+    },
+}
@@ -3,6 +3,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import health, metrics_view, request_stats
+
 handler403 = 'core.views.permission_denied'
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
@@ -12,6 +14,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
+    path('stats/requests/', request_stats, name='request_stats'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('health/', health, name='health'),
     path('', include('posts.urls', namespace='posts')),
 ]
 